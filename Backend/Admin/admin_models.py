@@ -1,4 +1,6 @@
 from pydantic import BaseModel, EmailStr,Field
+from typing import Any, Dict, List, Literal
+from datetime import datetime
 
 class AdminLogin(BaseModel):
     email: EmailStr
@@ -9,4 +11,26 @@ class LoanSchemeModel(BaseModel):
     interest_rate: float = Field(..., example=7.5)
     max_amount: float = Field(..., example=200000)
     description: str | None = Field(None, example="For students pursuing higher education")
-    status: str = Field(default="active")
\ No newline at end of file
+    status: str = Field(default="active")
+
+class ListPage(BaseModel):
+    page: int = Field(1, ge=1)
+    page_size: int = Field(50, ge=1, le=200)
+    order: Literal["asc", "desc"] = "desc"
+
+class AccountListFilter(ListPage):
+    status: str | None = None               # active/blocked
+    account_type: str | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    sort_by: Literal["created_at", "balance", "account_number"] = "created_at"
+
+class LoanListFilter(ListPage):
+    status: str | None = None
+    scheme_id: str | None = None
+    sort_by: Literal["applied_at", "created_at", "amount"] = "applied_at"
+    include_applicant: bool = False
+
+class BulkAccountRequest(BaseModel):
+    # rows are validated one by one so a bad row is reported instead of failing the request
+    accounts: List[Dict[str, Any]] = Field(..., min_length=1, max_length=5000)
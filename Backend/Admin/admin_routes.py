@@ -1,13 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File
+from fastapi.responses import PlainTextResponse
 from app.db import accounts_collection, loans_collection
-from app.auth import get_current_admin, hash_password
-from datetime import datetime
+from app.auth import get_current_admin, hash_password_async, hash_queue
+from datetime import datetime, timedelta
 from app.utils import serialize_list, serialize_doc
-from .admin_models import LoanSchemeModel
+from .admin_models import LoanSchemeModel, AccountListFilter, LoanListFilter, ListPage, BulkAccountRequest
 from bson import ObjectId
 from app.db import loan_schemes_collection
 from app.models import Account
-import uuid
+from app.cache import principal_cache
+from app.indexes import audit_query_plans
+from app import amortization
+from app.rollups import mark_dirty, get_dashboard
+from app.routers.loans import BILLING_CYCLE_DAYS
+from app.snapshots import balances_on, naive_utc
+from app.catalog import scheme_catalog
+from app.serializers import MongoJSONResponse, encode_account, encode_loan
+from app.loaders import RequestLoaders, get_loaders, ACCOUNT_SUMMARY_PROJECTION
+from app import idempotency
+from app.hot_accounts import hot_registry, hot_credits
+from app.events import emit_loan, event_bus
+from app.versions import versioned, touch_loans
+from app.diagnostics import loop_monitor, sample_profile, PROFILE_MAX_SECONDS
+from app.onboarding import account_numbers, account_document, account_from_csv_row, onboard_accounts, MAX_ONBOARDING_ROWS
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import csv
+import io
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -23,37 +45,106 @@ async def create_account(
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    # Unique account number
-    while True:
-        account_number = "ACC" + str(uuid.uuid4().int)[:6]
-        if not await accounts_collection.find_one({"account_number": account_number}):
-            break
-
-    # Convert & hash
-    account_data = account.dict()
-    account_data["customer"]["password"] = hash_password(account.customer.password)
-    balance = round(float(account.initial_deposit), 2)
-    new_account = {
-        "account_number": account_number,
-        "account_type": account.account_type,
-        "balance": balance,
-        "status": "active",
-        "created_at": datetime.utcnow(),
-        "customer": account_data["customer"]
-    }
-
-    result = await accounts_collection.insert_one(new_account)
+    password_hash = await hash_password_async(account.customer.password)
+    new_account = account_document(account, await account_numbers.next(), password_hash)
+
+    try:
+        result = await accounts_collection.insert_one(new_account)
+    except DuplicateKeyError:
+        # counter-issued numbers cannot collide (see app.onboarding), so this is the email
+        raise HTTPException(status_code=400, detail="Email already registered")
+    mark_dirty("accounts")
     if result.inserted_id:
-        return {"message": "Account created successfully", "account_number": account_number}
+        return {"message": "Account created successfully", "account_number": new_account["account_number"]}
 
     raise HTTPException(status_code=500, detail="Account creation failed")
 
 
+@router.post("/accounts/bulk")
+async def create_accounts_bulk(
+    batch: BulkAccountRequest,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Onboard many accounts at once; each row is reported as created, duplicate or invalid
+    """
+    return MongoJSONResponse(await onboard_accounts(batch.accounts))
+
+
+@router.post("/accounts/bulk/upload")
+async def create_accounts_bulk_upload(
+    file: UploadFile = File(...),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    CSV with a header row; columns are listed in app.onboarding.CSV_FIELDS
+    """
+    text = (await file.read()).decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or not {"account_type", "initial_deposit", "email", "password"} <= set(reader.fieldnames):
+        raise HTTPException(status_code=400, detail="CSV must have at least account_type, initial_deposit, email and password columns")
+
+    payloads = [account_from_csv_row(row) for row in reader]
+    if not payloads or len(payloads) > MAX_ONBOARDING_ROWS:
+        raise HTTPException(status_code=400, detail=f"An upload must contain 1 to {MAX_ONBOARDING_ROWS} accounts")
+
+    return MongoJSONResponse(await onboard_accounts(payloads))
+
+
 # -------------------- Account Management --------------------
+# listings never ship password hashes or KYC subdocuments
+ACCOUNT_LIST_PROJECTION = {
+    "customer.password": 0,
+    "customer.id_proof": 0,
+    "customer.address": 0,
+    "customer.nominee": 0,
+}
+LOAN_LIST_PROJECTION = {"description": 0}
+
+
+async def paginate(collection, query: dict, projection: dict, params: ListPage, sort_by: str, encode):
+    """
+    One page of a filtered, sorted, projected listing plus the total match count
+    """
+    direction = -1 if params.order == "desc" else 1
+    cursor = collection.find(query, projection) \
+        .sort([(sort_by, direction), ("_id", direction)]) \
+        .skip((params.page - 1) * params.page_size) \
+        .limit(params.page_size)
+    docs = await cursor.to_list(params.page_size)
+
+    if query:
+        total = await collection.count_documents(query)
+    else:
+        # metadata count, no scan
+        total = await collection.estimated_document_count()
+    return total, [encode(doc) for doc in docs]
+
+
 @router.get("/accounts")
-async def get_all_accounts(current_admin: dict = Depends(get_current_admin)):
-    accounts = await accounts_collection.find().to_list(100)
-    return {"total_accounts": len(accounts), "accounts": serialize_list(accounts)}
+async def get_all_accounts(
+    filters: AccountListFilter = Depends(),
+    current_admin: dict = Depends(get_current_admin)
+):
+    query = {}
+    if filters.status:
+        query["status"] = filters.status
+    if filters.account_type:
+        query["account_type"] = filters.account_type
+    if filters.created_from or filters.created_to:
+        query["created_at"] = {}
+        if filters.created_from:
+            query["created_at"]["$gte"] = filters.created_from
+        if filters.created_to:
+            query["created_at"]["$lte"] = filters.created_to
+
+    total, accounts = await paginate(accounts_collection, query, ACCOUNT_LIST_PROJECTION, filters, filters.sort_by, encode_account)
+    return MongoJSONResponse({
+        "total_accounts": total,
+        "page": filters.page,
+        "page_size": filters.page_size,
+        "accounts": accounts,
+    })
 
 
 @router.put("/block/{account_id}")
@@ -68,12 +159,14 @@ async def block_account(account_id: str, current_admin: dict = Depends(get_curre
 
     result = await accounts_collection.update_one(
         {"_id": obj_id},
-        {"$set": {"status": "blocked"}}
+        versioned({"$set": {"status": "blocked"}})
     )
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail=f"Account with ID {account_id} not found")
 
+    principal_cache.invalidate_account(obj_id)
+    mark_dirty("accounts")
     return {"message": f"Account {account_id} has been blocked successfully."}
 
 
@@ -89,22 +182,201 @@ async def unblock_account(account_id: str, current_admin: dict = Depends(get_cur
 
     result = await accounts_collection.update_one(
         {"_id": obj_id},
-        {"$set": {"status": "active"}}
+        versioned({"$set": {"status": "active"}})
     )
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail=f"Account with ID {account_id} not found")
 
+    principal_cache.invalidate_account(obj_id)
+    mark_dirty("accounts")
     return {"message": f"Account {account_id} has been unblocked successfully."}
 
 
+@router.put("/accounts/{account_id}/hot")
+async def set_hot_account(account_id: str, enabled: bool = True, current_admin: dict = Depends(get_current_admin)):
+    """
+    Flag an account as hot: credits to it are queued and applied in batches
+    """
+    try:
+        obj_id = ObjectId(account_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid account ID format")
+
+    account = await accounts_collection.find_one_and_update(
+        {"_id": obj_id},
+        versioned({"$set": {"hot": True}} if enabled else {"$unset": {"hot": ""}}),
+        projection={"account_number": 1},
+    )
+    if not account:
+        raise HTTPException(status_code=404, detail=f"Account with ID {account_id} not found")
+
+    # other workers pick the change up on their next registry refresh
+    hot_registry.set(account["account_number"], obj_id, enabled)
+    principal_cache.invalidate_account(obj_id)
+    return {"message": f"Account {account_id} hot mode {'enabled' if enabled else 'disabled'}."}
+
+
+@router.get("/dashboard")
+async def get_admin_dashboard(refresh: bool = False, current_admin: dict = Depends(get_current_admin)):
+    """
+    Portfolio totals from the materialized rollup; refresh=true recomputes it first
+    """
+    return MongoJSONResponse(await get_dashboard(refresh))
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_admin: dict = Depends(get_current_admin)):
+    """
+    Principal-cache hit/miss counters, password-hashing queue depth, idempotency replays and push connections
+    """
+    return MongoJSONResponse({
+        "principal_cache": principal_cache.stats(),
+        "password_hashing": dict(hash_queue),
+        "idempotency": idempotency.stats(),
+        "hot_accounts": hot_credits.stats(),
+        "events": event_bus.stats(),
+    })
+
+
+@router.get("/diagnostics/query-plans")
+async def get_query_plans(current_admin: dict = Depends(get_current_admin)):
+    """
+    explain() every query shape the routers issue and flag collection scans
+    """
+    return MongoJSONResponse(await audit_query_plans())
+
+
+@router.get("/diagnostics/loop-stalls")
+async def get_loop_stalls(current_admin: dict = Depends(get_current_admin)):
+    """
+    Recent event-loop stalls with the stack that was running when each was caught
+    """
+    return MongoJSONResponse(loop_monitor.recent())
+
+
+@router.get("/diagnostics/profile")
+async def get_profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Sample every thread's stack for `seconds`; returns collapsed stacks for flamegraph.pl or speedscope
+    """
+    try:
+        text, samples = await sample_profile(seconds, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(text, headers={
+        "Content-Disposition": f'attachment; filename="profile-{datetime.utcnow():%Y%m%dT%H%M%S}.folded"',
+        "X-Profile-Samples": str(samples),
+    })
+
+
+@router.get("/balances-at")
+async def get_balances_at(
+    date: datetime,
+    after: str | None = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    End-of-day balances of all accounts for one date (e.g. month-end), paged by account_id
+    """
+    date = naive_utc(date)
+    rows = await balances_on(date, after, limit)
+    return MongoJSONResponse({
+        "date": date.date().isoformat(),
+        "count": len(rows),
+        "next_after": rows[-1]["account_id"] if len(rows) == limit else None,
+        "balances": rows,
+    })
+
+
 # -------------------- Loan Management --------------------
 
 @router.get("/loans")
-async def view_all_loans(current_admin: dict = Depends(get_current_admin)):
-    loans = await loans_collection.find().to_list(100)
-    loans = serialize_list(loans)           # <-- MUST be called here
-    return {"total_loans": len(loans), "loans": loans}
+async def view_all_loans(
+    filters: LoanListFilter = Depends(),
+    loaders: RequestLoaders = Depends(get_loaders),
+    current_admin: dict = Depends(get_current_admin)
+):
+    query = {}
+    if filters.status:
+        query["status"] = filters.status
+    if filters.scheme_id:
+        query["scheme_id"] = filters.scheme_id
+
+    total, loans = await paginate(loans_collection, query, LOAN_LIST_PROJECTION, filters, filters.sort_by, encode_loan)
+
+    if filters.include_applicant:
+        # one batched $in per collection however many rows share an applicant or scheme
+        applicants, schemes = await asyncio.gather(
+            loaders.accounts.load_many([loan.get("user_id") for loan in loans]),
+            loaders.schemes.load_many([loan.get("scheme_id") for loan in loans]),
+        )
+        for loan, applicant, scheme in zip(loans, applicants, schemes):
+            loan["applicant"] = applicant
+            loan["scheme"] = {k: scheme.get(k) for k in REVIEW_SCHEME_FIELDS} if scheme else None
+    return MongoJSONResponse({
+        "total_loans": total,
+        "page": filters.page,
+        "page_size": filters.page_size,
+        "loans": loans,
+    })
+
+REVIEW_SCHEME_FIELDS = ("name", "interest_rate", "max_amount", "status")
+
+
+@router.get("/loans/review")
+async def review_loans(
+    status: str = "pending",
+    params: ListPage = Depends(),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Loans joined with applicant and scheme in a single aggregation
+    """
+    direction = -1 if params.order == "desc" else 1
+    pipeline = [
+        {"$match": {"status": status}},
+        {"$sort": {"applied_at": direction, "_id": direction}},
+        {"$skip": (params.page - 1) * params.page_size},
+        {"$limit": params.page_size},
+        {"$project": LOAN_LIST_PROJECTION},
+        {"$addFields": {
+            "_user_oid": {"$convert": {"input": "$user_id", "to": "objectId", "onError": None, "onNull": None}},
+            "_scheme_oid": {"$convert": {"input": "$scheme_id", "to": "objectId", "onError": None, "onNull": None}},
+        }},
+        {"$lookup": {
+            "from": accounts_collection.name,
+            "localField": "_user_oid",
+            "foreignField": "_id",
+            "pipeline": [{"$project": ACCOUNT_SUMMARY_PROJECTION}],
+            "as": "applicant",
+        }},
+        {"$lookup": {
+            "from": loan_schemes_collection.name,
+            "localField": "_scheme_oid",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {field: 1 for field in REVIEW_SCHEME_FIELDS}}],
+            "as": "scheme",
+        }},
+        {"$set": {
+            "applicant": {"$first": "$applicant"},
+            "scheme": {"$first": "$scheme"},
+        }},
+        {"$unset": ["_user_oid", "_scheme_oid"]},
+    ]
+    loans = await loans_collection.aggregate(pipeline).to_list(params.page_size)
+    return MongoJSONResponse({
+        "status": status,
+        "page": params.page,
+        "page_size": params.page_size,
+        "loans": [encode_loan(loan) for loan in loans],
+    })
+
 
 @router.put("/loans/approve/{loan_id}")
 async def approve_loan(loan_id: str, current_admin: dict = Depends(get_current_admin)):
@@ -119,30 +391,34 @@ async def approve_loan(loan_id: str, current_admin: dict = Depends(get_current_a
         elif status == "Rejected":
             raise HTTPException(status_code=400, detail="Loan has been rejected previously")
 
-        # calculate EMI and totals
+        # reducing-balance EMI and totals
         amount = float(loan.get("amount", 0))
         rate = float(loan.get("interest_rate", 0))
         months = int(loan.get("duration_months", 1))
-        interest = (amount * rate * months) / (12 * 100)
-        total = amount + interest
-        emi = round(total / months, 2)
+        emi = round(float(amortization.emi(amount, rate, months)), 2)
+        total = round(emi * months, 2)
+        approved_at = datetime.utcnow()
         update_data = {
             "status": "Approved",
-            "approved_at": datetime.utcnow(),
+            "approved_at": approved_at,
             "emi_amount": emi,
             "total_amount": total,
             "remaining_months": months,
-            "next_due_date": datetime.utcnow(),
+            # the first EMI falls due one billing cycle after approval
+            "next_due_date": approved_at + timedelta(days=BILLING_CYCLE_DAYS),
             "admin_approved_by": str(current_admin["id"]),
         }
 
-        await loans_collection.update_one({"_id": ObjectId(loan_id)}, {"$set": update_data})
+        await loans_collection.update_one({"_id": ObjectId(loan_id)}, versioned({"$set": update_data}))
+        await touch_loans(loan["user_id"])
+        mark_dirty("loans")
+        emit_loan(loan["user_id"], loan_id, "Approved", emi_amount=emi, total_amount=total)
         return {"message": "✅ Loan approved successfully!"}
 
     except HTTPException as e:
         raise e
-    except Exception as e:
-        print("Error in approve_loan:", e)
+    except Exception:
+        logger.exception("Error in approve_loan")
         raise HTTPException(status_code=500, detail="Failed to approve loan due to server error")
 
 
@@ -161,21 +437,24 @@ async def reject_loan(loan_id: str, current_admin: dict = Depends(get_current_ad
 
         await loans_collection.update_one(
             {"_id": ObjectId(loan_id)},
-            {
+            versioned({
                 "$set": {
                     "status": "Rejected",
                     "rejected_at": datetime.utcnow(),
                     "admin_rejected_by": str(current_admin["id"]),
                 }
-            },
+            }),
         )
+        await touch_loans(loan["user_id"])
 
+        mark_dirty("loans")
+        emit_loan(loan["user_id"], loan_id, "Rejected")
         return {"message": "❌ Loan rejected successfully!"}
 
     except HTTPException as e:
         raise e
-    except Exception as e:
-        print("Error in reject_loan:", e)
+    except Exception:
+        logger.exception("Error in reject_loan")
         raise HTTPException(status_code=500, detail="Failed to reject loan due to server error")
 
 
@@ -190,16 +469,16 @@ async def launch_loan_scheme(scheme: LoanSchemeModel, current_admin: dict = Depe
     scheme_data["created_at"] = datetime.utcnow()
 
     result = await loan_schemes_collection.insert_one(scheme_data)
+    await scheme_catalog.bump()
     new_scheme = await loan_schemes_collection.find_one({"_id": result.inserted_id})
 
-    return {"message": "Loan scheme launched successfully!", "loan_scheme": serialize_doc(new_scheme)}
+    return MongoJSONResponse({"message": "Loan scheme launched successfully!", "loan_scheme": serialize_doc(new_scheme)})
 
 
 
 @router.get("/loans/schemes")
 async def get_all_loan_schemes(current_admin: dict = Depends(get_current_admin)):
-    schemes = await loan_schemes_collection.find().to_list(100)
-    return {"total_schemes": len(schemes), "loan_schemes": serialize_list(schemes)}
+    return Response(content=await scheme_catalog.full_listing(), media_type="application/json")
 
 @router.put("/loans/schemes/{scheme_id}/status")
 async def update_scheme_status(scheme_id: str, status: str, current_admin: dict = Depends(get_current_admin)):
@@ -216,4 +495,5 @@ async def update_scheme_status(scheme_id: str, status: str, current_admin: dict
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Loan scheme not found")
 
+    await scheme_catalog.bump()
     return {"message": f"Loan scheme status updated to {status}"}
\ No newline at end of file
@@ -0,0 +1,93 @@
+
+import numpy as np
+
+# Reducing-balance amortization, vectorized over loans and months.
+# For a monthly rate r and n instalments the outstanding balance after k payments is
+#     B_k = P * ((1 + r)^n - (1 + r)^k) / ((1 + r)^n - 1)        (P * (1 - k/n) when r == 0)
+# so a whole schedule is a broadcast over k instead of a month-by-month loop.
+
+
+def _monthly_rate(annual_rate):
+    return np.asarray(annual_rate, dtype=np.float64) / 1200.0
+
+
+def emi(principal, annual_rate, months):
+    """
+    EMI formula: [P x R x (1+R)^N] / [(1+R)^N - 1]; scalars or equal-length arrays
+    """
+    p = np.asarray(principal, dtype=np.float64)
+    r = _monthly_rate(annual_rate)
+    n = np.asarray(months, dtype=np.float64)
+
+    growth = np.power(1.0 + r, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = p * r * growth / (growth - 1.0)
+    return np.where(r == 0, p / n, amortized)
+
+
+def book_schedules(principal, annual_rate, months):
+    """
+    Month-by-month schedules for many loans in one pass.
+    Returns (emi, interest, principal_paid, balance); the last three are
+    (loans x max_tenure) arrays, zero past each loan's own tenure.
+    """
+    p = np.atleast_1d(np.asarray(principal, dtype=np.float64))
+    r = np.atleast_1d(_monthly_rate(annual_rate))
+    n = np.atleast_1d(np.asarray(months, dtype=np.int64))
+
+    payment = emi(p, r * 1200.0, n)
+    k = np.arange(0, int(n.max()) + 1, dtype=np.float64)              # 0..T
+
+    growth_n = np.power(1.0 + r, n)
+    balance = np.power(1.0 + r[:, None], k)                           # (1+r)^k
+    np.subtract(growth_n[:, None], balance, out=balance)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        balance *= (p / (growth_n - 1.0))[:, None]
+
+    zero_rate = r == 0
+    if zero_rate.any():
+        balance[zero_rate] = p[zero_rate, None] * (1.0 - k / n[zero_rate, None])
+
+    # nothing is owed past the tenure, so interest and principal there come out as zero too
+    balance[k[None, :] > n[:, None]] = 0.0
+    np.maximum(balance, 0.0, out=balance)
+
+    interest = balance[:, :-1] * r[:, None]
+    principal_paid = balance[:, :-1] - balance[:, 1:]
+    return payment, interest, principal_paid, balance[:, 1:]
+
+
+def iter_book_schedules(principal, annual_rate, months, chunk_size: int = 100_000):
+    """
+    book_schedules over fixed-size chunks so memory stays bounded for a large book
+    """
+    p = np.asarray(principal, dtype=np.float64)
+    r = np.asarray(annual_rate, dtype=np.float64)
+    n = np.asarray(months, dtype=np.int64)
+    for start in range(0, len(p), chunk_size):
+        end = start + chunk_size
+        yield start, book_schedules(p[start:end], r[start:end], n[start:end])
+
+
+def loan_schedule(principal: float, annual_rate: float, months: int) -> dict:
+    """
+    Rounded schedule of a single loan, ready to serialize
+    """
+    payment, interest, principal_paid, balance = book_schedules([principal], [annual_rate], [months])
+    rows = [
+        {
+            "month": i + 1,
+            "emi": round(float(payment[0]), 2),
+            "interest": round(float(interest[0, i]), 2),
+            "principal": round(float(principal_paid[0, i]), 2),
+            "balance": round(float(balance[0, i]), 2),
+        }
+        for i in range(months)
+    ]
+    emi_amount = round(float(payment[0]), 2)
+    return {
+        "emi_amount": emi_amount,
+        "total_amount": round(emi_amount * months, 2),
+        "total_interest": round(float(interest[0].sum()), 2),
+        "schedule": rows,
+    }
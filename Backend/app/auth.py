@@ -4,10 +4,28 @@ from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import asyncio
 import os
+import statistics
+import time
+from .metrics import PASSWORD_HASH_LATENCY
+
+load_dotenv()
+
 # Use only Argon2 for hashing and verification
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# cost parameters come from `python -m app.auth --calibrate <target_ms>`
+ARGON2_SETTINGS = {
+    f"argon2__{name}": int(os.getenv(env))
+    for name, env in (
+        ("time_cost", "ARGON2_TIME_COST"),
+        ("memory_cost", "ARGON2_MEMORY_COST"),
+        ("parallelism", "ARGON2_PARALLELISM"),
+    )
+    if os.getenv(env)
+}
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", **ARGON2_SETTINGS)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -15,8 +33,68 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# -------------------- Off-loop password hashing --------------------
+# argon2-cffi releases the GIL, so a small thread pool keeps hashing off the event loop.
+# PASSWORD_HASH_WORKERS bounds CPU use; requests beyond PASSWORD_HASH_MAX_PENDING are shed.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="argon2")
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+hash_queue = {"pending": 0, "running": 0, "rejected": 0}
+
+async def _run_hashing(fn, *args):
+    if hash_queue["pending"] >= PASSWORD_HASH_MAX_PENDING:
+        hash_queue["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many authentication requests in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    hash_queue["pending"] += 1
+    start = time.perf_counter()
+    try:
+        async with _hash_slots:
+            hash_queue["running"] += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+            finally:
+                hash_queue["running"] -= 1
+    finally:
+        hash_queue["pending"] -= 1
+        PASSWORD_HASH_LATENCY.labels(fn.__name__).observe(time.perf_counter() - start)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+def calibrate_argon2(target_ms: float, memory_cost: int = 65536, parallelism: int = 2, rounds: int = 5) -> dict:
+    """
+    Largest time_cost whose median hash time on this machine stays within target_ms
+    """
+    best = {"time_cost": 1, "memory_cost": memory_cost, "parallelism": parallelism, "median_ms": None}
+    for time_cost in range(1, 21):
+        context = CryptContext(
+            schemes=["argon2"],
+            argon2__time_cost=time_cost,
+            argon2__memory_cost=memory_cost,
+            argon2__parallelism=parallelism,
+        )
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            context.hash("calibration-password")
+            samples.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(samples)
+        if median > target_ms and best["median_ms"] is not None:
+            break
+        best.update(time_cost=time_cost, median_ms=round(median, 2))
+    return best
+
 # JWT Token
-load_dotenv()
 SECRET_KEY = os.getenv("APP_SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
@@ -36,6 +114,7 @@ def decode_access_token(token: str) -> str | None:
 # ------------------------------
 from .db import accounts_collection
 from .auth import decode_access_token
+from .cache import principal_cache, build_principal, MUTABLE_PROJECTION
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
@@ -44,11 +123,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if not email:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
+    cached = principal_cache.get(email)
+    if cached:
+        identity, mutable = cached
+        if mutable is None:
+            mutable = await accounts_collection.find_one({"_id": identity["_id"]}, MUTABLE_PROJECTION)
+            if not mutable:
+                principal_cache.invalidate_account(identity["_id"])
+                raise HTTPException(status_code=404, detail="User not found")
+            mutable.pop("_id", None)
+            principal_cache.put_mutable(email, mutable)
+        return build_principal(identity, mutable)
+
     account = await accounts_collection.find_one({"customer.email": email})
     if not account:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    return account
+
+    principal_cache.put(email, account)
+    return build_principal(account, {})
 
 admin_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/admin/auth/login")
 
@@ -76,4 +168,17 @@ async def get_current_admin(token: str = Depends(admin_oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    return { "id": id,"email": email, "role": role }
\ No newline at end of file
+    return { "id": id,"email": email, "role": role }
+
+if __name__ == "__main__":
+    # python -m app.auth --calibrate <target_ms> [memory_cost_kib]
+    import sys
+    args = sys.argv[1:]
+    if args[:1] == ["--calibrate"]:
+        target = float(args[1]) if len(args) > 1 else 50.0
+        memory = int(args[2]) if len(args) > 2 else 65536
+        result = calibrate_argon2(target, memory)
+        print(f"# median {result['median_ms']} ms per hash (target {target} ms)")
+        print(f"ARGON2_TIME_COST={result['time_cost']}")
+        print(f"ARGON2_MEMORY_COST={result['memory_cost']}")
+        print(f"ARGON2_PARALLELISM={result['parallelism']}")
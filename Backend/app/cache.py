@@ -0,0 +1,192 @@
+
+import os
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl_seconds: float | None = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def peek(self, key):
+        """
+        Value without touching the stats, the LRU order or the expiry
+        """
+        item = self._data.get(key)
+        return item[1] if item else None
+
+    def replace(self, key, value):
+        """
+        Swap the value of a live entry, keeping its expiry
+        """
+        item = self._data.get(key)
+        if item:
+            self._data[key] = (item[0], value)
+
+    def pop(self, key):
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# -------------------- Principal cache --------------------
+# Identity fields never change for an account, so they are kept apart from the
+# mutable ones and live for PRINCIPAL_CACHE_TTL_SECONDS. The mutable half
+# (balance, status, version counters) is invalidated explicitly:
+#   - the ledger refreshes it from the document its write returned, and drops
+#     it for the other accounts the write touched;
+#   - with change streams, the feed drops it on every account update made by
+#     any worker, so it can live as long as the identity half;
+#   - without change streams, writes made on other workers are not seen, so it
+#     also expires after PRINCIPAL_BALANCE_TTL_SECONDS and is re-read by _id.
+MUTABLE_FIELDS = ("balance", "status", "version", "loans_version")
+MUTABLE_PROJECTION = {field: 1 for field in MUTABLE_FIELDS}
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+PRINCIPAL_BALANCE_TTL_SECONDS = float(os.getenv("PRINCIPAL_BALANCE_TTL_SECONDS", "2"))
+
+
+class PrincipalCache:
+    """
+    Caches the account behind a token subject (customer email)
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, mutable_ttl_seconds: float):
+        self._entries = TTLCache(max_entries, ttl_seconds)
+        self._subject_by_id = {}
+        self.mutable_ttl_seconds = mutable_ttl_seconds
+        self.refreshes = 0
+
+    def get(self, subject: str):
+        """
+        Returns (identity, mutable) or None; mutable is None when it was invalidated or expired
+        """
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        identity, mutable, fresh_until = entry
+        if mutable is None or fresh_until < time.monotonic():
+            # an identity hit that still costs a read of the mutable fields
+            self.refreshes += 1
+            return identity, None
+        return identity, mutable
+
+    def put(self, subject: str, account: dict):
+        identity = {k: v for k, v in account.items() if k not in MUTABLE_FIELDS}
+        mutable = {k: account[k] for k in MUTABLE_FIELDS if k in account}
+        self._entries.set(subject, (identity, mutable, time.monotonic() + self.mutable_ttl_seconds))
+        self._subject_by_id[str(account["_id"])] = subject
+        if len(self._subject_by_id) > 2 * self._entries.max_entries:
+            self._prune_ids()
+
+    def put_mutable(self, subject: str, mutable: dict):
+        entry = self._entries.peek(subject)
+        if entry:
+            self._entries.replace(subject, (entry[0], mutable, time.monotonic() + self.mutable_ttl_seconds))
+
+    def _drop_mutable(self, subject: str):
+        entry = self._entries.peek(subject)
+        if entry:
+            self._entries.replace(subject, (entry[0], None, 0))
+
+    def invalidate_balance(self, account_id):
+        """
+        Drop the mutable half so the next lookup re-reads balance and status only
+        """
+        subject = self._subject_by_id.get(str(account_id))
+        if subject:
+            self._drop_mutable(subject)
+
+    def invalidate_all_balances(self):
+        """
+        After the change feed may have missed updates
+        """
+        for subject in list(self._entries._data):
+            self._drop_mutable(subject)
+
+    def invalidate_account(self, account_id):
+        subject = self._subject_by_id.pop(str(account_id), None)
+        if subject:
+            self._entries.pop(subject)
+
+    def clear(self):
+        self._entries.clear()
+        self._subject_by_id.clear()
+
+    def _prune_ids(self):
+        live = set(self._entries._data)
+        self._subject_by_id = {k: s for k, s in self._subject_by_id.items() if s in live}
+
+    def stats(self) -> dict:
+        stats = self._entries.stats()
+        # only hits whose mutable half was still fresh saved the Mongo read
+        stats.update(
+            mutable_ttl_seconds=self.mutable_ttl_seconds,
+            full_hits=stats["hits"] - self.refreshes,
+            refreshes=self.refreshes,
+        )
+        return stats
+
+
+principal_cache = PrincipalCache(
+    PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_BALANCE_TTL_SECONDS
+)
+
+
+def build_principal(identity: dict, mutable: dict) -> dict:
+    """
+    Assemble a fresh account dict; callers are free to mutate it
+    """
+    account = {**identity, **mutable}
+    if "customer" in account:
+        account["customer"] = dict(account["customer"])
+    return account
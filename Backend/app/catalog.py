@@ -0,0 +1,83 @@
+
+import asyncio
+import os
+import time
+from pymongo import ReturnDocument
+from .db import loan_schemes_collection, cache_versions_collection
+from .utils import serialize_list
+from .serializers import dumps
+
+# Loan schemes change only through the admin launch/status routes, which bump a
+# version counter in Mongo. Each worker serves schemes from memory and compares
+# its loaded version with that counter at most every CATALOG_STALENESS_SECONDS,
+# so all workers converge within that window after an admin change.
+CATALOG_STALENESS_SECONDS = float(os.getenv("CATALOG_STALENESS_SECONDS", "5"))
+VERSION_ID = "loan_schemes"
+
+
+def _listing(schemes: list) -> bytes:
+    return dumps({"total_schemes": len(schemes), "loan_schemes": serialize_list(schemes)})
+
+
+class SchemeCatalog:
+    def __init__(self):
+        self.version = None
+        self._checked_at = 0.0
+        self._by_id = {}
+        self._active_payload = b""
+        self._all_payload = b""
+        self._lock = asyncio.Lock()
+
+    async def _remote_version(self) -> int:
+        doc = await cache_versions_collection.find_one({"_id": VERSION_ID})
+        return doc["version"] if doc else 0
+
+    async def _reload(self, version: int):
+        schemes = await loan_schemes_collection.find().to_list(None)
+        self._by_id = {scheme["_id"]: scheme for scheme in schemes}
+        self._active_payload = _listing([s for s in schemes if s.get("status") == "active"])
+        self._all_payload = _listing(schemes)
+        self.version = version
+
+    async def ensure_fresh(self):
+        if self.version is not None and time.monotonic() - self._checked_at < CATALOG_STALENESS_SECONDS:
+            return
+        async with self._lock:
+            if self.version is not None and time.monotonic() - self._checked_at < CATALOG_STALENESS_SECONDS:
+                return
+            version = await self._remote_version()
+            if version != self.version:
+                await self._reload(version)
+            self._checked_at = time.monotonic()
+
+    async def get(self, scheme_id):
+        await self.ensure_fresh()
+        scheme = self._by_id.get(scheme_id)
+        if scheme is None:
+            # may have been launched on another worker inside the staleness window
+            scheme = await loan_schemes_collection.find_one({"_id": scheme_id})
+        return scheme
+
+    async def active_listing(self) -> bytes:
+        await self.ensure_fresh()
+        return self._active_payload
+
+    async def full_listing(self) -> bytes:
+        await self.ensure_fresh()
+        return self._all_payload
+
+    async def bump(self) -> int:
+        """
+        Called after any scheme write; invalidates every worker's copy
+        """
+        doc = await cache_versions_collection.find_one_and_update(
+            {"_id": VERSION_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._checked_at = 0.0
+        return doc["version"]
+
+
+scheme_catalog = SchemeCatalog()
@@ -2,14 +2,26 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
+from .metrics import mongo_command_metrics
 
 load_dotenv()
 MONGO_URL = os.getenv("MONGO_URL")
-client = AsyncIOMotorClient(MONGO_URL)
+MONGO_DB = os.getenv("MONGO_DB", "banking_system")
+client = AsyncIOMotorClient(MONGO_URL, event_listeners=[mongo_command_metrics])
 
-db = client["banking_system"]  
+db = client[MONGO_DB]
 accounts_collection = db["accounts"] 
 transactions_collection = db["transactions"]
 loans_collection = db["loans"]
 loan_schemes_collection = db["loan_schemes"]
 admin_collection = db["admins"]
+emi_history_collection = db["emi_history"]
+payment_batches_collection = db["payment_batches"]
+rollups_collection = db["dashboard_rollups"]
+job_checkpoints_collection = db["job_checkpoints"]
+balance_snapshots_collection = db["balance_snapshots"]
+cache_versions_collection = db["cache_versions"]
+idempotency_keys_collection = db["idempotency_keys"]
+counters_collection = db["counters"]
+transaction_buckets_collection = db["transaction_buckets"]
+transaction_archive_collection = db["transaction_archive"]
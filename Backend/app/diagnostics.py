@@ -0,0 +1,164 @@
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from .metrics import LOOP_STALLS, LOOP_STALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Event-loop stall detector --------------------
+# A heartbeat task on the loop stamps the time every LOOP_HEARTBEAT_SECONDS.
+# A watchdog thread checks the stamp; when it is older than the threshold the
+# loop is stuck in some synchronous callback, so the watchdog grabs the loop
+# thread's current stack from sys._current_frames() while it is still stuck.
+# Off by default: turn it on while chasing latency spikes. Each stall is logged
+# as one WARNING line; the full stack goes to DEBUG and to the stall history,
+# and the WARNING itself is limited to one per LOOP_STALL_LOG_INTERVAL_SECONDS.
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "false").lower() == "true"
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "250"))
+LOOP_HEARTBEAT_SECONDS = float(os.getenv("LOOP_HEARTBEAT_SECONDS", "0.1"))
+LOOP_STALL_HISTORY = int(os.getenv("LOOP_STALL_HISTORY", "50"))
+LOOP_STALL_LOG_INTERVAL_SECONDS = float(os.getenv("LOOP_STALL_LOG_INTERVAL_SECONDS", "60"))
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float, heartbeat_seconds: float, history: int, log_interval: float):
+        self.threshold = threshold_ms / 1000
+        self.heartbeat_seconds = heartbeat_seconds
+        self.log_interval = log_interval
+        self._last_logged = None
+        self._unlogged = 0
+        self.stalls = deque(maxlen=history)
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._current = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    async def beat(self):
+        """
+        Run by the scheduler every heartbeat_seconds
+        """
+        now = time.monotonic()
+        if self._current is not None:
+            self._finish_stall(now)
+        self._beat = now
+
+    def _finish_stall(self, now: float):
+        stall, self._current = self._current, None
+        # the heartbeat itself sleeps heartbeat_seconds, so only the rest is lag
+        stall["duration_ms"] = round((now - self._beat - self.heartbeat_seconds) * 1000, 1)
+        LOOP_STALL_SECONDS.observe(stall["duration_ms"] / 1000)
+        logger.debug("Event loop blocked for %.0f ms in:\n%s", stall["duration_ms"], "".join(stall["stack"]))
+        if self._last_logged is not None and now - self._last_logged < self.log_interval:
+            self._unlogged += 1
+            return
+        # the innermost frame is enough to point at the culprit; DEBUG has the rest
+        logger.warning(
+            "Event loop blocked for %.0f ms at %s (%d more stalls since last report)",
+            stall["duration_ms"], stall["stack"][-1].strip().splitlines()[0], self._unlogged,
+        )
+        self._last_logged = now
+        self._unlogged = 0
+
+    def _watch(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            lag = time.monotonic() - self._beat - self.heartbeat_seconds
+            if lag < self.threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._current = {
+                "detected_at": datetime.utcnow(),
+                "duration_ms": None,  # filled in once the loop gets going again
+                "stack": traceback.format_stack(frame),
+            }
+            self.stalls.append(self._current)
+            LOOP_STALLS.inc()
+
+    def start(self):
+        if self._watchdog and self._watchdog.is_alive():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def recent(self) -> dict:
+        return {
+            "enabled": LOOP_MONITOR_ENABLED,
+            "threshold_ms": self.threshold * 1000,
+            "stalls": [dict(stall) for stall in reversed(self.stalls)],
+        }
+
+
+loop_monitor = LoopLagMonitor(
+    LOOP_STALL_THRESHOLD_MS, LOOP_HEARTBEAT_SECONDS, LOOP_STALL_HISTORY, LOOP_STALL_LOG_INTERVAL_SECONDS
+)
+
+
+# -------------------- Sampling profiler --------------------
+# Samples every thread's stack from a background thread and folds them into
+# "frame;frame;frame count" lines, the input format of flamegraph.pl / speedscope.
+PROFILE_MAX_SECONDS = 60
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> list:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _sample(seconds: float, interval: float) -> tuple:
+    me = threading.get_ident()
+    names = {}
+    folded = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread in threading.enumerate():
+            names[thread.ident] = thread.name
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = [names.get(thread_id, str(thread_id))] + _collapse(frame)
+            folded[";".join(stack)] += 1
+        samples += 1
+        time.sleep(interval)
+    return folded, samples
+
+
+async def sample_profile(seconds: float, interval_ms: float) -> tuple:
+    """
+    Profile the live process for `seconds`; returns (collapsed stacks text, sample count).
+    Raises RuntimeError when another profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        folded, samples = await asyncio.to_thread(_sample, seconds, interval_ms / 1000)
+    finally:
+        _profile_lock.release()
+    text = "".join(f"{stack} {count}\n" for stack, count in folded.most_common())
+    return text, samples
@@ -0,0 +1,229 @@
+
+import asyncio
+import itertools
+import logging
+import os
+from .db import client, accounts_collection, transactions_collection, loans_collection
+from .cache import principal_cache, MUTABLE_FIELDS, PRINCIPAL_CACHE_TTL_SECONDS
+from .serializers import encode_transaction
+
+logger = logging.getLogger(__name__)
+
+# Per-account push feed behind /events. Every worker keeps the connections of
+# its own clients in an EventBus; events reach the bus from one of two sources:
+#   change_streams  watches on accounts, transactions and loans (replica set only),
+#                   so every worker sees writes made by any worker or job
+#   local           the write paths call emit_*() after they commit; only writes
+#                   made by this worker are seen
+# EVENT_FEED=auto picks change streams when the server is a replica set member.
+# In change-stream mode the emit_*() hooks are no-ops so nothing is sent twice.
+EVENT_FEED = os.getenv("EVENT_FEED", "auto")
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+EVENT_FEED_RESTART_SECONDS = 1.0
+
+
+class Subscription:
+    """
+    One connection's bounded queue; a slow reader loses old events and is told to resync
+    """
+
+    def __init__(self, account_id: str):
+        self.account_id = account_id
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overflowed = True
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: float):
+        """
+        Next event, or None when nothing arrived within timeout (time for a heartbeat)
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self.mode = "local"
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, account_id) -> Subscription:
+        subscription = Subscription(str(account_id))
+        self._subscribers.setdefault(subscription.account_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.account_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.account_id]
+
+    def publish(self, account_id, event: dict):
+        subscribers = self._subscribers.get(str(account_id))
+        if not subscribers:
+            return
+        event = {"id": next(self._ids), **event}
+        for subscription in subscribers:
+            if subscription.queue.full():
+                self.dropped += 1
+            subscription.put(event)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "accounts": len(self._subscribers),
+            "connections": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+event_bus = EventBus()
+
+
+# -------------------- Event shapes --------------------
+def balance_event(balance, status: str | None = None) -> dict:
+    event = {"type": "balance", "balance": round(float(balance), 2)}
+    if status is not None:
+        event["status"] = status
+    return event
+
+
+def transaction_event(leg: dict) -> dict:
+    return {"type": "transaction", "transaction": encode_transaction(leg)}
+
+
+def loan_event(loan_id, status: str, **fields) -> dict:
+    return {"type": "loan", "loan_id": str(loan_id), "status": status, **fields}
+
+
+# -------------------- Local source --------------------
+def emit_legs(legs: list):
+    """
+    After a ledger write commits: one transaction event per leg and one balance
+    event per account, taken from that account's newest leg
+    """
+    if event_bus.mode != "local":
+        return
+    newest = {}
+    for leg in legs:
+        event_bus.publish(leg["account_id"], transaction_event(leg))
+        newest[leg["account_id"]] = leg["balance_after"]
+    for account_id, balance in newest.items():
+        event_bus.publish(account_id, balance_event(balance))
+
+
+def emit_loan(user_id, loan_id, status: str, **fields):
+    if event_bus.mode != "local":
+        return
+    event_bus.publish(user_id, loan_event(loan_id, status, **fields))
+
+
+# -------------------- Change-stream source --------------------
+class ChangeStreamFeed:
+    """
+    Feeds the bus from change streams. Each watch is a scheduler job that runs
+    until the stream fails and is then restarted from its last resume token.
+    Account changes also invalidate this worker's principal cache, which is
+    what lets cached balances outlive PRINCIPAL_BALANCE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self._resume = {}
+
+    async def _watch(self, name: str, collection, pipeline: list, handle, **options):
+        resume = self._resume.get(name)
+        try:
+            async with collection.watch(pipeline, resume_after=resume, **options) as stream:
+                if resume is None and name == "accounts":
+                    # updates made while no stream was open were never seen
+                    principal_cache.invalidate_all_balances()
+                async for change in stream:
+                    handle(change)
+                    self._resume[name] = stream.resume_token
+        except Exception:
+            # a token that fell off the oplog cannot be resumed; start from now next time
+            self._resume.pop(name, None)
+            raise
+
+    @staticmethod
+    def _on_account(change: dict):
+        account_id = change["documentKey"]["_id"]
+        description = change.get("updateDescription", {})
+        updated = description.get("updatedFields", {})
+        changed = set(updated) | set(description.get("removedFields", []))
+        if change["operationType"] != "update" or changed - set(MUTABLE_FIELDS):
+            # another worker changed identity fields or replaced the document
+            principal_cache.invalidate_account(account_id)
+        else:
+            principal_cache.invalidate_balance(account_id)
+        if "balance" in updated:
+            event_bus.publish(account_id, balance_event(updated["balance"], updated.get("status")))
+
+    @staticmethod
+    def _on_transaction(change: dict):
+        leg = change["fullDocument"]
+        event_bus.publish(leg["account_id"], transaction_event(leg))
+
+    @staticmethod
+    def _on_loan(change: dict):
+        loan = change.get("fullDocument")
+        if loan:
+            event_bus.publish(loan["user_id"], loan_event(loan["_id"], loan.get("status")))
+
+    async def watch_accounts(self):
+        await self._watch("accounts", accounts_collection, [
+            {"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}},
+            {"$project": {"documentKey": 1, "operationType": 1, "updateDescription": 1}},
+        ], self._on_account)
+
+    async def watch_transactions(self):
+        await self._watch("transactions", transactions_collection, [
+            {"$match": {"operationType": "insert"}},
+        ], self._on_transaction)
+
+    async def watch_loans(self):
+        await self._watch("loans", loans_collection, [
+            {"$match": {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}}},
+        ], self._on_loan, full_document="updateLookup")
+
+
+change_feed = ChangeStreamFeed()
+
+
+async def start_event_feed(scheduler):
+    """
+    Pick the event source for this worker and start the change-stream watches if used
+    """
+    if EVENT_FEED == "local":
+        return event_bus.mode
+    try:
+        hello = await client.admin.command("hello")
+        if "setName" not in hello:
+            if EVENT_FEED == "change_streams":
+                logger.warning("EVENT_FEED=change_streams needs a replica set; using the in-process bus")
+            return event_bus.mode
+
+        event_bus.mode = "change_streams"
+        # every account update now reaches the cache, so balances can be kept as long as identities
+        principal_cache.mutable_ttl_seconds = PRINCIPAL_CACHE_TTL_SECONDS
+        scheduler.start_periodic("events_accounts", EVENT_FEED_RESTART_SECONDS, change_feed.watch_accounts)
+        scheduler.start_periodic("events_transactions", EVENT_FEED_RESTART_SECONDS, change_feed.watch_transactions)
+        scheduler.start_periodic("events_loans", EVENT_FEED_RESTART_SECONDS, change_feed.watch_loans)
+    except Exception:
+        # the push feed is optional; never let it keep the API from starting
+        logger.warning("Could not set up change streams; using the in-process bus", exc_info=True)
+        event_bus.mode = "local"
+    return event_bus.mode
@@ -0,0 +1,283 @@
+
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from bson import ObjectId
+from pymongo import ReturnDocument
+from .db import client, accounts_collection, transactions_collection
+from .cache import principal_cache
+from .ledger import ledger_entry, balance_change
+from .rollups import record_balance_change
+from .events import emit_legs
+from .idempotency import transaction
+
+logger = logging.getLogger(__name__)
+
+# Write-combining for hot receivers. Every transfer to an account flagged
+# `hot` debits the sender and writes the sender's leg, marked
+# credit_status="pending", in the sender's own transaction; the receiver
+# document is not touched. Pending credits are queued in memory and a flusher
+# applies them per receiver as one balance update plus one insert_many of receiver legs,
+# flipping the sender legs to "applied" in the same transaction. The pending
+# legs are the durable queue.
+#
+# Each pending leg is owned by the worker that wrote it (credit_owner) under a
+# lease (credit_lease_until) that the owner renews on every recovery tick. A
+# worker only applies legs it owns, and the recovery sweep only reclaims legs
+# whose lease has expired, i.e. whose owner died or shut down, so a booting
+# or sweeping worker never takes credits out of a live worker's queue.
+#
+# Off by default: it changes when receivers of flagged accounts see credits.
+HOT_ACCOUNTS_ENABLED = os.getenv("HOT_ACCOUNTS_ENABLED", "false").lower() == "true"
+HOT_FLUSH_INTERVAL_SECONDS = float(os.getenv("HOT_FLUSH_INTERVAL_SECONDS", "0.05"))
+HOT_REGISTRY_REFRESH_SECONDS = float(os.getenv("HOT_REGISTRY_REFRESH_SECONDS", "30"))
+HOT_RECOVERY_INTERVAL_SECONDS = float(os.getenv("HOT_RECOVERY_INTERVAL_SECONDS", "30"))
+HOT_CREDIT_LEASE_SECONDS = float(os.getenv("HOT_CREDIT_LEASE_SECONDS", "120"))
+HOT_FLUSH_MAX_CREDITS = 5000
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+
+
+def _lease_until() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=HOT_CREDIT_LEASE_SECONDS)
+
+
+# -------------------- Registry --------------------
+class HotAccountRegistry:
+    """
+    account_number -> _id of every account flagged hot, reloaded periodically
+    """
+
+    def __init__(self):
+        self._by_number = {}
+        self.loaded_at = 0.0
+
+    async def refresh(self):
+        self._by_number = {
+            doc["account_number"]: doc["_id"]
+            async for doc in accounts_collection.find({"hot": True}, {"account_number": 1})
+        }
+        self.loaded_at = time.monotonic()
+
+    def lookup(self, account_number: str):
+        return self._by_number.get(account_number) if HOT_ACCOUNTS_ENABLED else None
+
+    def set(self, account_number: str, account_id, hot: bool):
+        if hot:
+            self._by_number[account_number] = account_id
+        else:
+            self._by_number.pop(account_number, None)
+
+    def __len__(self):
+        return len(self._by_number)
+
+
+hot_registry = HotAccountRegistry()
+
+
+# -------------------- Sender side --------------------
+async def transfer_to_hot_account(sender_id, receiver_id, receiver_account_number: str, amount: float):
+    """
+    Debit the sender and record a pending credit; returns the updated sender.
+    The receiver is credited by the next flush.
+    """
+    async def _debit(session):
+        sender = await accounts_collection.find_one_and_update(
+            {"_id": sender_id, "status": "active", "balance": {"$gte": amount}},
+            balance_change(-amount),
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if not sender:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+
+        leg = ledger_entry(sender_id, "transfer_sent", amount, sender["balance"],
+                           to_account=receiver_account_number,
+                           receiver_id=str(receiver_id), credit_status="pending",
+                           credit_owner=WORKER_ID, credit_lease_until=_lease_until())
+        await transactions_collection.insert_one(leg, session=session)
+        return sender, leg
+
+    sender, leg = await transaction(_debit)
+
+    hot_credits.add(receiver_id, {
+        "leg_id": leg["_id"],
+        "amount": amount,
+        "from_account": sender["account_number"],
+    })
+    principal_cache.put(sender["customer"]["email"], sender)
+    record_balance_change(sender, -amount)
+    emit_legs([leg])
+    return sender
+
+
+# -------------------- Flusher --------------------
+class HotCreditBuffer:
+    def __init__(self):
+        self._pending = {}
+        self.flushed_credits = 0
+        self.flushes = 0
+
+    def add(self, receiver_id, credit: dict):
+        self._pending.setdefault(receiver_id, []).append(credit)
+
+    def depth(self) -> int:
+        return sum(len(credits) for credits in self._pending.values())
+
+    async def _apply(self, receiver_id, credits: list) -> int:
+        """
+        Credit one receiver with every leg in credits that is still pending and
+        still ours; legs reclaimed by another worker are dropped. Returns how many were applied
+        """
+        by_leg = {c["leg_id"]: c for c in credits}
+
+        async def _credit(session):
+            still_pending = [
+                doc["_id"] async for doc in transactions_collection.find(
+                    {"_id": {"$in": list(by_leg)}, "credit_status": "pending", "credit_owner": WORKER_ID},
+                    {"_id": 1}, session=session,
+                )
+            ]
+            if not still_pending:
+                return None, [], []
+            batch = [by_leg[leg_id] for leg_id in still_pending]
+            total = round(sum(c["amount"] for c in batch), 2)
+
+            receiver = await accounts_collection.find_one_and_update(
+                {"_id": receiver_id},
+                balance_change(total),
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+            if not receiver:
+                raise RuntimeError(f"Hot account {receiver_id} no longer exists")
+
+            # walk back from the final balance to give each leg its own balance_after
+            legs, balance = [], receiver["balance"]
+            for credit in reversed(batch):
+                legs.append(ledger_entry(receiver_id, "transfer_received", credit["amount"], balance,
+                                         from_account=credit["from_account"], sender_leg_id=credit["leg_id"]))
+                balance -= credit["amount"]
+            legs.reverse()
+
+            await transactions_collection.insert_many(legs, session=session)
+            await transactions_collection.update_many(
+                {"_id": {"$in": still_pending}},
+                {"$set": {"credit_status": "applied"},
+                 "$unset": {"credit_owner": "", "credit_lease_until": "", "credit_claim": ""}},
+                session=session,
+            )
+            return receiver, batch, legs
+
+        async with await client.start_session() as session:
+            receiver, batch, legs = await session.with_transaction(_credit)
+
+        if receiver:
+            principal_cache.invalidate_balance(receiver_id)
+            record_balance_change(receiver, sum(c["amount"] for c in batch))
+            emit_legs(legs)
+        return len(batch)
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+
+        applied = 0
+        for receiver_id, credits in pending.items():
+            for start in range(0, len(credits), HOT_FLUSH_MAX_CREDITS):
+                chunk = credits[start:start + HOT_FLUSH_MAX_CREDITS]
+                try:
+                    applied += await self._apply(receiver_id, chunk)
+                except Exception:
+                    # still pending in Mongo; retry on the next flush
+                    logger.exception("Hot-account flush for %s failed; %s credits requeued", receiver_id, len(chunk))
+                    for credit in chunk:
+                        self.add(receiver_id, credit)
+
+        if applied:
+            self.flushes += 1
+            self.flushed_credits += applied
+        return applied
+
+    def _queued_leg_ids(self) -> list:
+        return [c["leg_id"] for credits in self._pending.values() for c in credits]
+
+    async def renew(self):
+        """
+        Extend the lease on every credit still queued here
+        """
+        queued = self._queued_leg_ids()
+        if queued:
+            await transactions_collection.update_many(
+                {"_id": {"$in": queued}, "credit_status": "pending", "credit_owner": WORKER_ID},
+                {"$set": {"credit_lease_until": _lease_until()}},
+            )
+
+    async def release(self):
+        """
+        At shutdown, after the last flush: let other workers reclaim what is left right away
+        """
+        await transactions_collection.update_many(
+            {"credit_status": "pending", "credit_owner": WORKER_ID},
+            {"$set": {"credit_lease_until": datetime.utcnow()}},
+        )
+
+    async def recover(self):
+        """
+        Renew our own leases, then claim and queue pending credits whose lease expired
+        """
+        await self.renew()
+
+        claim = ObjectId()
+        # each document is matched and updated atomically, so of two sweeping workers only one claims a leg
+        result = await transactions_collection.update_many(
+            {"credit_status": "pending", "$or": [
+                {"credit_lease_until": {"$lt": datetime.utcnow()}},
+                {"credit_lease_until": {"$exists": False}},
+            ]},
+            {"$set": {"credit_owner": WORKER_ID, "credit_claim": claim, "credit_lease_until": _lease_until()}},
+        )
+        if not result.modified_count:
+            return 0
+        legs = await transactions_collection.find(
+            {"credit_status": "pending", "credit_claim": claim},
+            {"receiver_id": 1, "amount": 1, "account_id": 1},
+        ).to_list(None)
+
+        sender_ids = list({ObjectId(leg["account_id"]) for leg in legs})
+        numbers = {
+            str(doc["_id"]): doc["account_number"]
+            async for doc in accounts_collection.find({"_id": {"$in": sender_ids}}, {"account_number": 1})
+        }
+        for leg in legs:
+            self.add(ObjectId(leg["receiver_id"]), {
+                "leg_id": leg["_id"],
+                "amount": leg["amount"],
+                "from_account": numbers.get(leg["account_id"]),
+            })
+        logger.warning("Recovered %s pending hot-account credits", len(legs))
+        return len(legs)
+
+    def stats(self) -> dict:
+        return {
+            "hot_accounts": len(hot_registry),
+            "queued_credits": self.depth(),
+            "flushes": self.flushes,
+            "flushed_credits": self.flushed_credits,
+            "worker_id": WORKER_ID,
+        }
+
+
+hot_credits = HotCreditBuffer()
+
+
+async def recover_startup():
+    """
+    Load the registry and pick up credits whose owner died or shut down
+    """
+    await hot_registry.refresh()
+    await hot_credits.recover()
@@ -0,0 +1,217 @@
+
+import asyncio
+import contextvars
+import hashlib
+import os
+from datetime import datetime, timedelta
+import orjson
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+from .db import client, idempotency_keys_collection
+from .cache import TTLCache
+from .serializers import MongoJSONResponse
+
+# Money-moving routes accept an Idempotency-Key header. The first request with a
+# key claims it in Mongo (unique _id) and stores its response when done; retries
+# with the same key get that stored response back without re-running the write.
+# A TTL index on created_at expires keys after IDEMPOTENCY_TTL_SECONDS, and a
+# small in-memory cache answers repeated retries without a round trip.
+#
+# The money write and the key's "applied" marker commit in one transaction
+# (see transaction() below), so a key is never released once its write may
+# have committed:
+#   in_progress  claimed; if the handler fails before its write started the
+#                key is deleted, otherwise it is left for its lease to expire
+#                and a retry then takes it over (the write did not commit)
+#   applied      the write committed; the response is stored next. If the
+#                owner dies in between, retries get a 409 instead of a replay
+#   completed    response stored; retries replay it
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_POLL_SECONDS = 0.05
+MAX_KEY_LENGTH = 255
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+_responses = TTLCache(IDEMPOTENCY_CACHE_MAX_ENTRIES, min(IDEMPOTENCY_TTL_SECONDS, 600))
+_in_flight = {}
+# the key being executed by the current request, seen by transaction()
+_current_write = contextvars.ContextVar("idempotency_write", default=None)
+
+
+async def transaction(fn, required: bool = True):
+    """
+    Run fn(session) in a transaction that also marks the current Idempotency-Key
+    applied. With required=False and no key, fn runs as is with session=None.
+    """
+    write = _current_write.get()
+    if write is None and not required:
+        return await fn(None)
+
+    async def _with_marker(session):
+        result = await fn(session)
+        if write is not None:
+            await idempotency_keys_collection.update_one(
+                {"_id": write["key_id"]},
+                {"$set": {"status": "applied", "applied_at": datetime.utcnow()}},
+                session=session,
+            )
+        return result
+
+    if write is not None:
+        write["started"] = True
+    async with await client.start_session() as session:
+        return await session.with_transaction(_with_marker)
+
+
+def _fingerprint(payload) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _replay(stored: dict, fingerprint: str) -> MongoJSONResponse:
+    if stored["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    return MongoJSONResponse(stored["body"], status_code=stored["status_code"], headers={REPLAY_HEADER: "true"})
+
+
+async def _claim(key_id: str, fingerprint: str) -> dict | None:
+    """
+    Claim the key; returns None when claimed, otherwise the existing record
+    """
+    now = datetime.utcnow()
+    try:
+        await idempotency_keys_collection.insert_one({
+            "_id": key_id,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "created_at": now,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # take over a claim whose owner died before finishing
+    taken = await idempotency_keys_collection.find_one_and_update(
+        {"_id": key_id, "status": "in_progress", "locked_until": {"$lt": now}},
+        {"$set": {"fingerprint": fingerprint,
+                  "locked_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}},
+    )
+    if taken:
+        return None
+    return await idempotency_keys_collection.find_one({"_id": key_id}) or {"status": "in_progress"}
+
+
+async def _wait_for_owner(key_id: str) -> dict:
+    """
+    Poll a key claimed by another worker until its response is stored; None
+    when the owner gave up before its write committed
+    """
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_LEASE_SECONDS
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+        record = await idempotency_keys_collection.find_one({"_id": key_id})
+        if record is None or record["status"] == "completed":
+            return record
+        if record.get("locked_until", datetime.max) < datetime.utcnow():
+            if record["status"] == "applied":
+                # the owner died between its commit and storing the response; never run it again
+                return {"fingerprint": record["fingerprint"], "status_code": 409, "body": {
+                    "detail": "The request with this Idempotency-Key was applied but its response was lost",
+                }}
+            return None
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+
+async def _abandon(key_id: str, write: dict):
+    """
+    The handler failed. Only a key whose write never started is freed for retries
+    """
+    if not write["started"]:
+        await idempotency_keys_collection.delete_one({"_id": key_id, "status": "in_progress"})
+
+
+async def _execute(key_id: str, fingerprint: str, handler) -> dict:
+    write = {"key_id": key_id, "started": False}
+    token = _current_write.set(write)
+    try:
+        body = await handler()
+        stored = {"fingerprint": fingerprint, "status_code": 200, "body": body}
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await _abandon(key_id, write)
+            raise
+        # client errors (e.g. insufficient balance) are part of the recorded outcome
+        stored = {"fingerprint": fingerprint, "status_code": e.status_code, "body": {"detail": e.detail}}
+    except BaseException:
+        await _abandon(key_id, write)
+        raise
+    finally:
+        _current_write.reset(token)
+
+    await idempotency_keys_collection.update_one(
+        {"_id": key_id},
+        {"$set": {**stored, "status": "completed", "completed_at": datetime.utcnow()},
+         "$unset": {"locked_until": ""}},
+    )
+    _responses.set(key_id, stored)
+    return stored
+
+
+async def run_idempotent(key: str | None, account: dict, scope: str, payload, handler):
+    """
+    Run handler() once per (account, scope, key); without a key it just runs.
+    handler must return a JSON-able dict; the stored copy is what replays see.
+    Either way the body goes out through MongoJSONResponse, not jsonable_encoder.
+    """
+    if key is None:
+        return MongoJSONResponse(await handler())
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+    key_id = f"{account['_id']}:{scope}:{key}"
+    fingerprint = _fingerprint(payload)
+
+    stored = _responses.get(key_id)
+    if stored:
+        return _replay(stored, fingerprint)
+
+    # a duplicate arriving at this worker while the first is running shares its result
+    pending = _in_flight.get(key_id)
+    if pending:
+        return _replay(await asyncio.shield(pending), fingerprint)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key_id] = future
+    try:
+        existing = await _claim(key_id, fingerprint)
+        if existing is None:
+            stored = await _execute(key_id, fingerprint, handler)
+            future.set_result(stored)
+            if stored["status_code"] != 200:
+                raise HTTPException(status_code=stored["status_code"], detail=stored["body"]["detail"])
+            return MongoJSONResponse(stored["body"])
+
+        if existing["status"] != "completed":
+            existing = await _wait_for_owner(key_id)
+            if existing is None:
+                raise HTTPException(status_code=409, detail="The original request with this Idempotency-Key failed, please retry")
+        _responses.set(key_id, existing)
+        future.set_result(existing)
+        return _replay(existing, fingerprint)
+    except BaseException as e:
+        if not future.done():
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved so an unawaited future does not log
+        raise
+    finally:
+        _in_flight.pop(key_id, None)
+
+
+def stats() -> dict:
+    return {"cached_responses": _responses.stats(), "in_flight": len(_in_flight)}
+
@@ -0,0 +1,154 @@
+
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from .db import (
+    accounts_collection,
+    transactions_collection,
+    loans_collection,
+    loan_schemes_collection,
+    emi_history_collection,
+    payment_batches_collection,
+    balance_snapshots_collection,
+    idempotency_keys_collection,
+    transaction_buckets_collection,
+    transaction_archive_collection,
+)
+from .idempotency import IDEMPOTENCY_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Index registry --------------------
+# (collection, keys, options) - every query shape below must be served by one of these
+INDEXES = [
+    (accounts_collection, [("customer.email", ASCENDING)], {"unique": True, "name": "uniq_customer_email"}),
+    (accounts_collection, [("account_number", ASCENDING)], {"unique": True, "name": "uniq_account_number"}),
+    (accounts_collection, [("status", ASCENDING), ("created_at", DESCENDING)], {"name": "status_created"}),
+    (accounts_collection, [("account_type", ASCENDING), ("created_at", DESCENDING)], {"name": "type_created"}),
+    (accounts_collection, [("created_at", DESCENDING)], {"name": "created"}),
+    (transactions_collection, [("account_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {"name": "account_timestamp_id"}),
+    (transaction_buckets_collection, [("account_id", ASCENDING), ("last_ts", DESCENDING)], {"name": "account_last_ts"}),
+    (transaction_buckets_collection, [("month", ASCENDING)], {"name": "month"}),
+    (transaction_archive_collection, [("account_id", ASCENDING), ("last_ts", DESCENDING)], {"name": "account_last_ts"}),
+    (accounts_collection, [("hot", ASCENDING)], {"name": "hot", "partialFilterExpression": {"hot": True}}),
+    (transactions_collection, [("credit_lease_until", ASCENDING)], {"name": "pending_credit_lease", "partialFilterExpression": {"credit_status": "pending"}}),
+    (transactions_collection, [("credit_claim", ASCENDING)], {"name": "pending_credit_claim", "partialFilterExpression": {"credit_status": "pending"}}),
+    (loans_collection, [("user_id", ASCENDING), ("status", ASCENDING)], {"name": "user_status"}),
+    (loans_collection, [("status", ASCENDING), ("applied_at", DESCENDING)], {"name": "status_applied"}),
+    (loans_collection, [("scheme_id", ASCENDING), ("status", ASCENDING)], {"name": "scheme_status"}),
+    (loans_collection, [("status", ASCENDING), ("next_due_date", ASCENDING)], {"name": "status_next_due"}),
+    (loan_schemes_collection, [("name", ASCENDING)], {"unique": True, "name": "uniq_scheme_name"}),
+    (loan_schemes_collection, [("status", ASCENDING)], {"name": "status"}),
+    (emi_history_collection, [("loan_id", ASCENDING), ("paid_on", DESCENDING)], {"name": "loan_paid_on"}),
+    (balance_snapshots_collection, [("account_id", ASCENDING), ("day", DESCENDING)], {"unique": True, "name": "uniq_account_day"}),
+    (balance_snapshots_collection, [("day", ASCENDING), ("account_id", ASCENDING)], {"name": "day_account"}),
+    (payment_batches_collection, [("sender_id", ASCENDING), ("created_at", DESCENDING)], {"name": "sender_created"}),
+    (idempotency_keys_collection, [("created_at", ASCENDING)], {"expireAfterSeconds": IDEMPOTENCY_TTL_SECONDS, "name": "ttl_created"}),
+]
+
+
+async def ensure_indexes():
+    """
+    Create any missing index from the registry; failures are logged, not fatal
+    """
+    created = []
+    for collection, keys, options in INDEXES:
+        try:
+            created.append(await collection.create_index(keys, **options))
+        except OperationFailure as e:
+            # typically a unique index over data that already has duplicates
+            logger.error("Could not create index %s on %s: %s", options.get("name"), collection.name, e)
+        except PyMongoError as e:
+            # server unreachable or similar; every other index would wait out the same timeout
+            logger.error("Could not create indexes, skipping the rest: %s", e)
+            break
+    return created
+
+
+# -------------------- Query-plan audit --------------------
+# Representative shapes of the queries the routers issue; values only need the right type
+SAMPLE_ID = "000000000000000000000000"
+SAMPLE_DAY = datetime(2024, 1, 1)
+
+QUERY_SHAPES = [
+    ("login / get_current_user", accounts_collection, {"customer.email": "audit@example.com"}, None),
+    ("transfer receiver lookup", accounts_collection, {"account_number": "ACC000000"}, None),
+    ("transaction history", transactions_collection, {"account_id": SAMPLE_ID}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("cold transaction history", transaction_buckets_collection, {"account_id": SAMPLE_ID, "first_ts": {"$lte": SAMPLE_DAY}}, [("last_ts", DESCENDING)]),
+    ("admin accounts by status", accounts_collection, {"status": "active"}, [("created_at", DESCENDING)]),
+    ("admin accounts by type", accounts_collection, {"account_type": "savings"}, [("created_at", DESCENDING)]),
+    ("my loans", loans_collection, {"user_id": SAMPLE_ID}, None),
+    ("active loans", loans_collection, {"user_id": SAMPLE_ID, "status": {"$in": ["Approved", "Ongoing"]}}, None),
+    ("admin loans by status", loans_collection, {"status": "pending"}, [("applied_at", DESCENDING)]),
+    ("admin loans by scheme", loans_collection, {"scheme_id": SAMPLE_ID}, None),
+    ("active schemes", loan_schemes_collection, {"status": "active"}, None),
+    ("scheme by name", loan_schemes_collection, {"name": "audit"}, None),
+    ("balance snapshot", balance_snapshots_collection, {"account_id": SAMPLE_ID, "day": SAMPLE_DAY}, None),
+    ("month-end balances", balance_snapshots_collection, {"day": SAMPLE_DAY}, [("account_id", ASCENDING)]),
+    ("emi history", emi_history_collection, {"loan_id": SAMPLE_ID}, None),
+    ("overdue scan", loans_collection, {"status": {"$in": ["Approved", "Ongoing"]}, "next_due_date": {"$lte": SAMPLE_DAY}},
+     [("next_due_date", ASCENDING), ("_id", ASCENDING)]),
+    ("hot credit reclaim", transactions_collection, {"credit_status": "pending", "$or": [
+        {"credit_lease_until": {"$lt": SAMPLE_DAY}}, {"credit_lease_until": {"$exists": False}},
+    ]}, None),
+    ("hot credit claimed legs", transactions_collection, {"credit_status": "pending", "credit_claim": ObjectId(SAMPLE_ID)}, None),
+    ("late legs' bucket", transaction_buckets_collection, {"account_id": SAMPLE_ID, "month": SAMPLE_DAY}, [("first_ts", ASCENDING)]),
+]
+
+
+def _plan_stages(plan) -> list:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+async def audit_query_plans() -> dict:
+    """
+    Run explain() on every registered query shape and flag collection scans
+    """
+    results = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        results.append({
+            "query": name,
+            "collection": collection.name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+
+    return {
+        "collscans": sum(1 for r in results if r["collscan"]),
+        "queries": results,
+    }
+
+
+async def _main(argv):
+    await ensure_indexes()
+    if "--audit" not in argv:
+        return 0
+
+    report = await audit_query_plans()
+    for row in report["queries"]:
+        flag = "COLLSCAN" if row["collscan"] else "ok"
+        print(f"{flag:9} {row['collection']:14} {row['query']}  {' > '.join(row['stages'])}")
+    return 1 if report["collscans"] else 0
+
+
+if __name__ == "__main__":
+    # python -m app.indexes [--audit]  (non-zero exit when a COLLSCAN is found)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
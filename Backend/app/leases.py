@@ -0,0 +1,54 @@
+
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from .db import job_checkpoints_collection
+
+# Background jobs (overdue scan, balance snapshots, tiering, dashboard rollups)
+# run on one worker at a time under a lease kept on their job_checkpoints
+# document, next to whatever progress the job checkpoints:
+#   acquire  take the lease if it is free or expired (creating the document on first run)
+#   renew    push the lease out again, saving progress in the same write
+#   release  end the lease now so the next run does not wait for it to expire
+
+
+async def acquire(job_id: str, now: datetime, seconds: float, initial: dict | None = None) -> dict | None:
+    """
+    Take job_id's lease; returns its checkpoint document, or None if another worker holds it.
+    `initial` seeds the document the first time the job runs.
+    """
+    lease_until = now + timedelta(seconds=seconds)
+    checkpoint = await job_checkpoints_collection.find_one_and_update(
+        {"_id": job_id, "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+        {"$set": {"lease_until": lease_until}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if checkpoint is not None:
+        return checkpoint
+
+    checkpoint = {"_id": job_id, **(initial or {}), "lease_until": lease_until}
+    try:
+        await job_checkpoints_collection.insert_one(checkpoint)
+    except DuplicateKeyError:
+        return None     # someone else holds the lease
+    return checkpoint
+
+
+async def renew(job_id: str, seconds: float, progress: dict | None = None):
+    """
+    Extend the lease by `seconds` from now, saving `progress` with it
+    """
+    await job_checkpoints_collection.update_one({"_id": job_id}, {"$set": {
+        **(progress or {}),
+        "lease_until": datetime.utcnow() + timedelta(seconds=seconds),
+    }})
+
+
+async def release(job_id: str, fields: dict | None = None):
+    """
+    Give the lease up now, saving `fields` with it
+    """
+    await job_checkpoints_collection.update_one({"_id": job_id}, {"$set": {
+        **(fields or {}),
+        "lease_until": datetime.utcnow(),
+    }})
@@ -0,0 +1,222 @@
+
+from datetime import datetime
+from fastapi import HTTPException
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from .db import accounts_collection, transactions_collection
+from .cache import principal_cache
+from .rollups import record_balance_change
+from .events import emit_legs
+from .versions import BUMP_STAGE
+from .idempotency import transaction
+
+
+def ledger_entry(account_id, txn_type: str, amount: float, balance_after: float, **extra) -> dict:
+    entry = {
+        "account_id": str(account_id),
+        "type": txn_type,
+        "amount": amount,
+        "balance_after": round(balance_after, 2),
+        "timestamp": datetime.utcnow(),
+    }
+    entry.update(extra)
+    return entry
+
+
+def balance_change(amount: float) -> list:
+    """
+    Pipeline update adding amount to the balance, rounded to 2 decimals on the
+    server so repeated float additions do not drift (1000.3000000000001)
+    """
+    return [{"$set": {"balance": {"$round": [{"$add": ["$balance", amount]}, 2]}, **BUMP_STAGE}}]
+
+
+# -------------------- Single-account balance changes --------------------
+async def _apply_single(query: dict, kind: str, amount: float, delta: float):
+    async def _apply(session):
+        account = await accounts_collection.find_one_and_update(
+            query, balance_change(delta), return_document=ReturnDocument.AFTER, session=session
+        )
+        if not account:
+            return None, None
+        leg = ledger_entry(account["_id"], kind, amount, account["balance"])
+        await transactions_collection.insert_one(leg, session=session)
+        return account, leg
+
+    # plain writes, unless the request carries an Idempotency-Key that must commit with them
+    account, leg = await transaction(_apply, required=False)
+    if account:
+        principal_cache.put(account["customer"]["email"], account)
+        record_balance_change(account, delta)
+        emit_legs([leg])
+    return account
+
+
+async def apply_deposit(account_id, amount: float):
+    """
+    Credit an account with one rounded update; returns the updated account or None
+    """
+    return await _apply_single({"_id": account_id}, "deposit", amount, amount)
+
+
+async def apply_withdraw(account_id, amount: float):
+    """
+    Debit an active account only if it holds enough balance; returns the updated account or None
+    """
+    return await _apply_single(
+        {"_id": account_id, "status": "active", "balance": {"$gte": amount}}, "withdraw", amount, -amount
+    )
+
+
+# -------------------- Transfers --------------------
+async def transfer_funds(sender_id, receiver_account_number: str, amount: float):
+    """
+    Move money between two accounts in one multi-document transaction.
+    with_transaction retries the whole callback on TransientTransactionError
+    and retries the commit on UnknownTransactionCommitResult.
+    Returns (sender, receiver) as they are after the transfer.
+    """
+    async def _transfer(session):
+        receiver = await accounts_collection.find_one_and_update(
+            {"account_number": receiver_account_number, "_id": {"$ne": sender_id}},
+            balance_change(amount),
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if not receiver:
+            raise HTTPException(status_code=404, detail="Receiver account not found")
+
+        sender = await accounts_collection.find_one_and_update(
+            {"_id": sender_id, "status": "active", "balance": {"$gte": amount}},
+            balance_change(-amount),
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if not sender:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+
+        legs = [
+            ledger_entry(sender_id, "transfer_sent", amount, sender["balance"],
+                         to_account=receiver_account_number),
+            ledger_entry(receiver["_id"], "transfer_received", amount, receiver["balance"],
+                         from_account=sender["account_number"]),
+        ]
+        await transactions_collection.insert_many(legs, session=session)
+        return sender, receiver, legs
+
+    sender, receiver, legs = await transaction(_transfer)
+
+    principal_cache.put(sender["customer"]["email"], sender)
+    principal_cache.invalidate_balance(receiver["_id"])
+    record_balance_change(sender, -amount)
+    record_balance_change(receiver, amount)
+    emit_legs(legs)
+    return sender, receiver
+
+
+# -------------------- Payment batches --------------------
+async def apply_payment_batch(sender: dict, payments: list, batch_id: ObjectId | None = None) -> dict:
+    """
+    Pay many receivers from one account: one $in lookup, one guarded debit of the
+    total, one bulk_write of credits and one insert_many of ledger legs, all in a
+    single transaction. Rows that cannot be paid are reported, not fatal.
+    """
+    batch_id = batch_id or ObjectId()
+    results = [
+        {"row": i, "receiver_account_number": p["receiver_account_number"], "amount": p["amount"], "status": "pending"}
+        for i, p in enumerate(payments)
+    ]
+
+    numbers = {r["receiver_account_number"] for r in results}
+    receivers = {
+        doc["account_number"]: doc["_id"]
+        async for doc in accounts_collection.find({"account_number": {"$in": list(numbers)}}, {"account_number": 1})
+    }
+
+    for r in results:
+        if r["amount"] <= 0:
+            r.update(status="failed", error="Transfer amount must be positive")
+        elif r["receiver_account_number"] == sender["account_number"]:
+            r.update(status="failed", error="Cannot transfer money to your own account")
+        elif r["receiver_account_number"] not in receivers:
+            r.update(status="failed", error="Receiver account not found")
+
+    payable = [r for r in results if r["status"] == "pending"]
+    total = round(sum(r["amount"] for r in payable), 2)
+
+    report = {"batch_id": str(batch_id), "total_rows": len(results), "results": results}
+    if not payable:
+        return {**report, "status": "failed", "succeeded": 0, "failed": len(results),
+                "total_debited": 0.0, "sender_new_balance": sender["balance"]}
+
+    credits = {}
+    for r in payable:
+        receiver_id = receivers[r["receiver_account_number"]]
+        credits[receiver_id] = credits.get(receiver_id, 0) + r["amount"]
+
+    async def _pay(session):
+        debited = await accounts_collection.find_one_and_update(
+            {"_id": sender["_id"], "status": "active", "balance": {"$gte": total}},
+            balance_change(-total),
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if not debited:
+            return None, [], {}
+
+        await accounts_collection.bulk_write(
+            [UpdateOne({"_id": rid}, balance_change(amount)) for rid, amount in credits.items()],
+            ordered=False,
+            session=session,
+        )
+        credited = {
+            doc["_id"]: doc
+            async for doc in accounts_collection.find(
+                {"_id": {"$in": list(credits)}}, {"balance": 1, "status": 1, "account_type": 1}, session=session
+            )
+        }
+        balances = {receiver_id: doc["balance"] for receiver_id, doc in credited.items()}
+
+        # walk the rows backwards from the final balances to get each leg's balance_after
+        pairs = []
+        sender_balance = debited["balance"]
+        for r in reversed(payable):
+            receiver_id = receivers[r["receiver_account_number"]]
+            pairs.append((
+                ledger_entry(sender["_id"], "transfer_sent", r["amount"], sender_balance,
+                             to_account=r["receiver_account_number"], batch_id=batch_id),
+                ledger_entry(receiver_id, "transfer_received", r["amount"], balances[receiver_id],
+                             from_account=sender["account_number"], batch_id=batch_id),
+            ))
+            sender_balance += r["amount"]
+            balances[receiver_id] -= r["amount"]
+        legs = [leg for pair in reversed(pairs) for leg in pair]
+
+        await transactions_collection.insert_many(legs, session=session)
+        return debited, legs, credited
+
+    debited, legs, credited = await transaction(_pay)
+
+    if not debited:
+        for r in payable:
+            r.update(status="failed", error="Insufficient balance")
+        return {**report, "status": "failed", "succeeded": 0, "failed": len(results),
+                "total_debited": 0.0, "sender_new_balance": sender["balance"]}
+
+    for r in payable:
+        r["status"] = "ok"
+    principal_cache.put(debited["customer"]["email"], debited)
+    record_balance_change(debited, -total)
+    for receiver_id, amount in credits.items():
+        principal_cache.invalidate_balance(receiver_id)
+        record_balance_change(credited[receiver_id], amount)
+    emit_legs(legs)
+
+    return {
+        **report,
+        "status": "completed" if len(payable) == len(results) else "partial",
+        "succeeded": len(payable),
+        "failed": len(results) - len(payable),
+        "total_debited": total,
+        "sender_new_balance": debited["balance"],
+    }
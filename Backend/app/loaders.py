@@ -0,0 +1,94 @@
+
+import asyncio
+from bson import ObjectId
+from fastapi import Request
+from .db import accounts_collection, loan_schemes_collection
+
+# Request-scoped data loaders: every load() issued during the same event-loop
+# tick is collected and resolved with a single $in query, and each key is
+# fetched at most once per request.
+
+
+class BatchLoader:
+    def __init__(self, batch_fn):
+        self._batch_fn = batch_fn
+        self._futures = {}
+        self._pending = []
+        # the loop keeps only weak references to tasks; hold them until they finish
+        self._tasks = set()
+
+    def prime(self, key, value):
+        if key not in self._futures:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._futures[key] = future
+
+    async def load(self, key):
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[key] = future
+            self._pending.append(key)
+            if len(self._pending) == 1:
+                loop.call_soon(self._start_dispatch)
+        return await future
+
+    async def load_many(self, keys) -> list:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def _start_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        keys, self._pending = self._pending, []
+        try:
+            found = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                self._futures.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._futures[key].set_result(found.get(key))
+
+
+def _object_ids(keys) -> list:
+    ids = []
+    for key in keys:
+        try:
+            ids.append(ObjectId(key))
+        except Exception:
+            pass
+    return ids
+
+
+# applicant summary only; never the customer's password hash or KYC data
+ACCOUNT_SUMMARY_PROJECTION = {
+    "account_number": 1, "account_type": 1, "balance": 1, "status": 1,
+    "customer.full_name": 1, "customer.email": 1, "customer.phone": 1,
+}
+
+
+async def _load_accounts(keys) -> dict:
+    docs = accounts_collection.find({"_id": {"$in": _object_ids(keys)}}, ACCOUNT_SUMMARY_PROJECTION)
+    return {str(doc["_id"]): doc async for doc in docs}
+
+
+async def _load_schemes(keys) -> dict:
+    docs = loan_schemes_collection.find({"_id": {"$in": _object_ids(keys)}})
+    return {str(doc["_id"]): doc async for doc in docs}
+
+
+class RequestLoaders:
+    def __init__(self):
+        self.accounts = BatchLoader(_load_accounts)
+        self.schemes = BatchLoader(_load_schemes)
+
+
+def get_loaders(request: Request) -> RequestLoaders:
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = request.state.loaders = RequestLoaders()
+    return loaders
@@ -1,12 +1,29 @@
 
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Response
 from .models import Account
 from .db import accounts_collection
 from datetime import datetime
-from .routers import users, accounts, loans
+from .routers import users, accounts, loans, events
 import uuid
 from .auth import hash_password
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
+from .indexes import ensure_indexes
+from .rollups import refresh_rollups, flush_balance_deltas, DASHBOARD_REFRESH_SECONDS
+from .overdue import run_overdue_scan, OVERDUE_SCANNER_ENABLED, OVERDUE_SCAN_INTERVAL_SECONDS
+from .snapshots import run_snapshot_job, SNAPSHOT_INTERVAL_SECONDS
+from .tiering import run_tiering, TXN_TIERING_ENABLED, TXN_TIERING_INTERVAL_SECONDS
+from .serializers import MongoJSONResponse
+from .metrics import MetricsMiddleware, render as render_metrics
+from . import scheduler
+from .events import start_event_feed
+from .diagnostics import loop_monitor, LOOP_MONITOR_ENABLED
+from .hot_accounts import (
+    hot_registry, hot_credits, recover_startup, HOT_ACCOUNTS_ENABLED,
+    HOT_FLUSH_INTERVAL_SECONDS, HOT_REGISTRY_REFRESH_SECONDS, HOT_RECOVERY_INTERVAL_SECONDS,
+)
+import logging
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -14,7 +31,37 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from Admin.admin_routes import router as admin_router
 from Admin.admin_auth import router as admin_auth_router
 
-app = FastAPI()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+        scheduler.start_periodic("loop_heartbeat", loop_monitor.heartbeat_seconds, loop_monitor.beat)
+    await ensure_indexes()
+    await start_event_feed(scheduler)
+    scheduler.start_periodic("dashboard_rollups", DASHBOARD_REFRESH_SECONDS, refresh_rollups)
+    if OVERDUE_SCANNER_ENABLED:
+        scheduler.start_periodic("overdue_scan", OVERDUE_SCAN_INTERVAL_SECONDS, run_overdue_scan)
+    scheduler.start_periodic("balance_snapshots", SNAPSHOT_INTERVAL_SECONDS, run_snapshot_job)
+    if TXN_TIERING_ENABLED:
+        scheduler.start_periodic("txn_tiering", TXN_TIERING_INTERVAL_SECONDS, run_tiering)
+    if HOT_ACCOUNTS_ENABLED:
+        await recover_startup()
+        scheduler.start_periodic("hot_registry", HOT_REGISTRY_REFRESH_SECONDS, hot_registry.refresh)
+        scheduler.start_periodic("hot_credit_flush", HOT_FLUSH_INTERVAL_SECONDS, hot_credits.flush)
+        scheduler.start_periodic("hot_credit_recovery", HOT_RECOVERY_INTERVAL_SECONDS, hot_credits.recover)
+    yield
+    await scheduler.stop_all()
+    if HOT_ACCOUNTS_ENABLED:
+        await hot_credits.flush()
+        await hot_credits.release()
+    await flush_balance_deltas()
+    loop_monitor.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=MongoJSONResponse)
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://fbi-2tr3.onrender.com"],  # React frontend
@@ -22,11 +69,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# outermost, so the recorded latency includes compression and CORS handling
+app.add_middleware(MetricsMiddleware)
 router = APIRouter(prefix="/users", tags=["users"])
 app.include_router(users.router)
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 app.include_router(accounts.router)
 app.include_router(loans.router)
+app.include_router(events.router)
 app.include_router(admin_router)
 app.include_router(admin_auth_router)
 
@@ -35,3 +85,9 @@ app.include_router(admin_auth_router)
 @app.get("/")
 async def root():
     return {"message": "API is working!"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
@@ -0,0 +1,129 @@
+
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from pymongo import monitoring
+
+# Prometheus metrics for the API process. With several uvicorn/gunicorn workers,
+# set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates every worker's samples.
+
+# -------------------- HTTP --------------------
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status code", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", ["method"], multiprocess_mode="livesum"
+)
+
+# -------------------- MongoDB --------------------
+MONGO_COMMANDS = Counter(
+    "mongo_commands_total", "MongoDB commands by collection, command and outcome", ["collection", "command", "outcome"]
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round-trip time", ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+# -------------------- Password hashing --------------------
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds", "Argon2 hash/verify time, queueing included", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+# -------------------- Event loop --------------------
+LOOP_STALLS = Counter("event_loop_stalls_total", "Times the event loop was blocked past the stall threshold")
+LOOP_STALL_SECONDS = Histogram(
+    "event_loop_stall_duration_seconds", "How long each detected stall blocked the loop",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: latency, in-flight and status counters per route template
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.labels(method).dec()
+            # the router stores the matched route in scope; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+
+# commands whose first value is not the collection name
+_COLLECTION_FIELDS = {"getMore": "collection"}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Registered on the Mongo client; times every command by collection and name
+    """
+
+    def __init__(self):
+        self._started = {}
+
+    def started(self, event):
+        field = _COLLECTION_FIELDS.get(event.command_name, event.command_name)
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._started[(event.request_id, event.connection_id)] = collection
+
+    def _finish(self, event, outcome: str):
+        collection = self._started.pop((event.request_id, event.connection_id), "-")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMANDS.labels(collection, event.command_name, outcome).inc()
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+def render() -> tuple:
+    """
+    Returns (body, content_type) in Prometheus text format
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,6 +1,6 @@
 
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 class Address(BaseModel):
@@ -53,9 +53,21 @@ class TransferRequest(BaseModel):
     receiver_account_number: str
     amount: float
 
+class BatchPayment(BaseModel):
+    receiver_account_number: str
+    amount: float
+
+class BatchTransferRequest(BaseModel):
+    payments: List[BatchPayment] = Field(..., min_length=1, max_length=5000)
+
 class TransactionFilter(BaseModel):
-    limit: Optional[int] = 10
-    skip: Optional[int] = 0
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None        # opaque token from the previous page's next_cursor
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    type: Optional[str] = None          # deposit, withdraw, transfer_sent, transfer_received
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
 
 class LoanRequest(BaseModel):
     loan_type: str = Field(..., example="personal")
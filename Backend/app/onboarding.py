@@ -0,0 +1,187 @@
+
+import asyncio
+import os
+from datetime import datetime
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from .db import accounts_collection, counters_collection
+from .auth import hash_password_async, PASSWORD_HASH_WORKERS
+from .models import Account
+from .rollups import mark_dirty
+
+# -------------------- Account numbers --------------------
+# A single counter document hands out blocks of sequence numbers; each worker
+# serves numbers from its current block and only goes back to Mongo when the
+# block runs out. Numbers are unique across workers, gaps after a restart are fine.
+# They start at ACC1000001 (7 digits) and legacy numbers were ACC + 6 random
+# digits, so the two can never collide: a duplicate key on insert is the email.
+ACCOUNT_NUMBER_START = 1000000
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv("ACCOUNT_NUMBER_BLOCK_SIZE", "100"))
+COUNTER_ID = "account_number"
+
+DUPLICATE_KEY = 11000
+
+
+class AccountNumberAllocator:
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve(self, count: int) -> int:
+        """
+        Reserve count sequence numbers; returns the first one
+        """
+        counter = await counters_collection.find_one_and_update(
+            {"_id": COUNTER_ID},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["seq"] - count + 1
+
+    async def take(self, count: int = 1) -> list:
+        async with self._lock:
+            numbers = []
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    block = max(self.block_size, count - len(numbers))
+                    self._next = await self._reserve(block)
+                    self._end = self._next + block
+                used = min(self._end - self._next, count - len(numbers))
+                numbers.extend(range(self._next, self._next + used))
+                self._next += used
+        return [f"ACC{ACCOUNT_NUMBER_START + seq}" for seq in numbers]
+
+    async def next(self) -> str:
+        return (await self.take(1))[0]
+
+
+account_numbers = AccountNumberAllocator(ACCOUNT_NUMBER_BLOCK_SIZE)
+
+
+def account_document(account: Account, account_number: str, password_hash: str) -> dict:
+    customer = account.customer.dict()
+    customer["password"] = password_hash
+    return {
+        "account_number": account_number,
+        "account_type": account.account_type,
+        "balance": round(float(account.initial_deposit), 2),
+        "status": "active",
+        "created_at": datetime.utcnow(),
+        "customer": customer,
+        "version": 1,
+    }
+
+
+# -------------------- Bulk onboarding --------------------
+MAX_ONBOARDING_ROWS = 5000
+
+# flat CSV columns -> nested Account fields
+CSV_FIELDS = {
+    "account_type": ("account_type",),
+    "initial_deposit": ("initial_deposit",),
+    "full_name": ("customer", "full_name"),
+    "dob": ("customer", "dob"),
+    "gender": ("customer", "gender"),
+    "email": ("customer", "email"),
+    "password": ("customer", "password"),
+    "phone": ("customer", "phone"),
+    "street": ("customer", "address", "street"),
+    "city": ("customer", "address", "city"),
+    "state": ("customer", "address", "state"),
+    "zip": ("customer", "address", "zip"),
+    "country": ("customer", "address", "country"),
+    "id_proof_type": ("customer", "id_proof", "type"),
+    "id_proof_number": ("customer", "id_proof", "number"),
+    "nominee_name": ("customer", "nominee", "name"),
+    "nominee_relation": ("customer", "nominee", "relation"),
+    "nominee_phone": ("customer", "nominee", "phone"),
+}
+
+
+def account_from_csv_row(row: dict) -> dict:
+    payload = {}
+    for column, path in CSV_FIELDS.items():
+        value = (row.get(column) or "").strip()
+        if not value:
+            continue
+        node = payload
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return payload
+
+
+async def _hash_all(passwords: list) -> list:
+    # a few at a time, so a large batch queues behind interactive logins instead of in front of them
+    hashes = []
+    for start in range(0, len(passwords), PASSWORD_HASH_WORKERS):
+        chunk = passwords[start:start + PASSWORD_HASH_WORKERS]
+        hashes.extend(await asyncio.gather(*(hash_password_async(p) for p in chunk)))
+    return hashes
+
+
+async def onboard_accounts(payloads: list) -> dict:
+    """
+    Validate, hash and insert many accounts with one unordered insert_many.
+    Invalid rows and duplicate emails (in the batch or already registered) are
+    reported per row; the rest are created.
+    """
+    results = [{"row": i, "email": None, "status": "pending"} for i in range(len(payloads))]
+    accounts = {}
+    for r, payload in zip(results, payloads):
+        try:
+            account = payload if isinstance(payload, Account) else Account(**payload)
+        except ValidationError as e:
+            r.update(status="invalid", error="; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+        r["email"] = account.customer.email
+        accounts[r["row"]] = account
+
+    seen = set()
+    for row, account in list(accounts.items()):
+        if account.customer.email in seen:
+            results[row].update(status="duplicate", error="Email appears earlier in this batch")
+            del accounts[row]
+        seen.add(account.customer.email)
+
+    registered = {
+        doc["customer"]["email"]
+        async for doc in accounts_collection.find({"customer.email": {"$in": list(seen)}}, {"customer.email": 1})
+    }
+    for row in [row for row, account in accounts.items() if account.customer.email in registered]:
+        results[row].update(status="duplicate", error="Email already registered")
+        del accounts[row]
+
+    rows = list(accounts)
+    if rows:
+        hashes = await _hash_all([accounts[row].customer.password for row in rows])
+        numbers = await account_numbers.take(len(rows))
+        docs = [account_document(accounts[row], number, h) for row, number, h in zip(rows, numbers, hashes)]
+
+        failed = {}
+        try:
+            await accounts_collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # another request registered the same email between the check and the insert
+            failed = {err["index"]: err for err in e.details.get("writeErrors", [])}
+
+        for i, (row, doc) in enumerate(zip(rows, docs)):
+            err = failed.get(i)
+            if err is None:
+                results[row].update(status="created", account_number=doc["account_number"])
+            elif err.get("code") == DUPLICATE_KEY:
+                results[row].update(status="duplicate", error="Email already registered")
+            else:
+                results[row].update(status="failed", error=err.get("errmsg", "Insert failed"))
+        mark_dirty("accounts")
+
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"total_rows": len(results), "counts": counts, "results": results}
@@ -0,0 +1,176 @@
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from .db import loans_collection, job_checkpoints_collection
+from . import leases
+from .routers.loans import LATE_PENALTY, DEFAULT_MONTHS, BILLING_CYCLE_DAYS
+from .rollups import mark_dirty
+from .versions import BUMP, touch_loans
+from .events import emit_loan
+
+logger = logging.getLogger(__name__)
+
+# Walks active loans whose next_due_date has passed, in (next_due_date, _id) order
+# on the status_next_due index, and accrues LATE_PENALTY per missed month.
+# A loan is marked Defaulted once DEFAULT_MONTHS payments are missed.
+# An EMI counts as missed once OVERDUE_GRACE_DAYS have passed after its
+# next_due_date without a payment moving that date on; every further billing
+# cycle without a payment is another missed month.
+#
+# Idempotency: a loan stores which due date it was penalised for and how many
+# months were already charged, so re-running for the same day charges nothing
+# twice. The checkpoint lets an interrupted run resume where it stopped, and its
+# lease keeps several workers from scanning at the same time.
+OVERDUE_SCANNER_ENABLED = os.getenv("OVERDUE_SCANNER_ENABLED", "true").lower() == "true"
+OVERDUE_SCAN_INTERVAL_SECONDS = float(os.getenv("OVERDUE_SCAN_INTERVAL_SECONDS", "3600"))
+OVERDUE_SCAN_CHUNK = int(os.getenv("OVERDUE_SCAN_CHUNK", "1000"))
+OVERDUE_GRACE_DAYS = int(os.getenv("OVERDUE_GRACE_DAYS", "0"))
+LEASE_SECONDS = 300
+
+CHECKPOINT_ID = "overdue_scan"
+ACTIVE_LOAN_STATUSES = ["Approved", "Ongoing"]
+SCAN_PROJECTION = {"next_due_date": 1, "penalised_due_date": 1, "missed_payments": 1, "user_id": 1}
+
+
+def missed_months(due: datetime, cutoff: datetime) -> int:
+    """
+    Payments missed by cutoff (which already has the grace taken off): the one due
+    on `due` as soon as cutoff is past it, plus one per full billing cycle since
+
+    >>> due = datetime(2024, 1, 1)
+    >>> missed_months(due, due), missed_months(due, due + timedelta(seconds=1))
+    (0, 1)
+    >>> [missed_months(due, due + timedelta(days=d)) for d in (29, 30, 59, 60)]
+    [1, 2, 2, 3]
+    """
+    if due >= cutoff:
+        return 0
+    return (cutoff - due).days // BILLING_CYCLE_DAYS + 1
+
+
+def penalty_update(loan: dict, cutoff: datetime):
+    """
+    UpdateOne accruing the penalty still owed for this loan, or None
+    """
+    due = loan["next_due_date"]
+    missed = missed_months(due, cutoff)
+    already = loan.get("missed_payments", 0) if loan.get("penalised_due_date") == due else 0
+    if missed <= already:
+        return None
+
+    # the filter pins the state we read, so a concurrent or repeated run cannot double-charge
+    if already:
+        guard = {"penalised_due_date": due, "missed_payments": already}
+    else:
+        guard = {"penalised_due_date": {"$ne": due}}
+
+    update = {
+        "$set": {"missed_payments": missed, "penalised_due_date": due, "last_penalty_at": cutoff},
+        "$inc": {"penalty_due": (missed - already) * LATE_PENALTY, **BUMP},
+    }
+    if missed >= DEFAULT_MONTHS:
+        update["$set"]["status"] = "Defaulted"
+        update["$set"]["defaulted_at"] = cutoff
+
+    return UpdateOne(
+        {"_id": loan["_id"], "status": {"$in": ACTIVE_LOAN_STATUSES}, "next_due_date": due, **guard},
+        update,
+    )
+
+
+async def _acquire(now: datetime):
+    """
+    Take the scan lease; resumes an unfinished run or starts a new one
+    """
+    checkpoint = await leases.acquire(CHECKPOINT_ID, now, LEASE_SECONDS, {"status": "completed"})
+    if checkpoint is None:
+        return None
+
+    if checkpoint.get("status") != "running":
+        checkpoint = {
+            "status": "running",
+            "cutoff": now - timedelta(days=OVERDUE_GRACE_DAYS),
+            "started_at": now,
+            "last_due": None,
+            "last_id": None,
+            "scanned": 0,
+            "penalised": 0,
+            "defaulted": 0,
+        }
+        await job_checkpoints_collection.update_one({"_id": CHECKPOINT_ID}, {"$set": checkpoint})
+    return checkpoint
+
+
+async def run_overdue_scan() -> dict | None:
+    """
+    One full pass over overdue loans in bounded chunks; returns the final checkpoint
+    """
+    checkpoint = await _acquire(datetime.utcnow())
+    if checkpoint is None:
+        logger.info("Overdue scan already running elsewhere")
+        return None
+
+    cutoff = checkpoint["cutoff"]
+    while True:
+        # loans due at or after the cutoff have not missed a payment yet
+        query = {"status": {"$in": ACTIVE_LOAN_STATUSES}, "next_due_date": {"$lt": cutoff}}
+        if checkpoint["last_due"] is not None:
+            query["$or"] = [
+                {"next_due_date": {"$gt": checkpoint["last_due"]}},
+                {"next_due_date": checkpoint["last_due"], "_id": {"$gt": checkpoint["last_id"]}},
+            ]
+
+        loans = await loans_collection.find(query, SCAN_PROJECTION) \
+            .sort([("next_due_date", 1), ("_id", 1)]) \
+            .limit(OVERDUE_SCAN_CHUNK) \
+            .to_list(OVERDUE_SCAN_CHUNK)
+        if not loans:
+            break
+
+        updates = [(loan, penalty_update(loan, cutoff)) for loan in loans]
+        ops = [op for _, op in updates if op]
+        if ops:
+            result = await loans_collection.bulk_write(ops, ordered=False)
+            checkpoint["penalised"] += result.modified_count
+            defaulted = await loans_collection.find(
+                {"_id": {"$in": [loan["_id"] for loan in loans]}, "defaulted_at": cutoff}, {"user_id": 1}
+            ).to_list(None)
+            checkpoint["defaulted"] += len(defaulted)
+            await touch_loans(*(loan["user_id"] for loan, op in updates if op))
+            mark_dirty("loans")
+            for loan in defaulted:
+                emit_loan(loan["user_id"], loan["_id"], "Defaulted")
+
+        checkpoint["scanned"] += len(loans)
+        checkpoint["last_due"] = loans[-1]["next_due_date"]
+        checkpoint["last_id"] = loans[-1]["_id"]
+        await leases.renew(CHECKPOINT_ID, LEASE_SECONDS, {
+            "last_due": checkpoint["last_due"],
+            "last_id": checkpoint["last_id"],
+            "scanned": checkpoint["scanned"],
+            "penalised": checkpoint["penalised"],
+            "defaulted": checkpoint["defaulted"],
+        })
+
+    checkpoint.update(status="completed", finished_at=datetime.utcnow())
+    await leases.release(CHECKPOINT_ID, {"status": "completed", "finished_at": checkpoint["finished_at"]})
+    logger.info("Overdue scan done: %s scanned, %s penalised", checkpoint["scanned"], checkpoint["penalised"])
+    return checkpoint
+
+
+async def _worker(once: bool):
+    while True:
+        await run_overdue_scan()
+        if once:
+            return
+        await asyncio.sleep(OVERDUE_SCAN_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    # standalone worker: python -m app.overdue [--once]
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker("--once" in sys.argv[1:]))
@@ -0,0 +1,235 @@
+
+import os
+from datetime import datetime
+from .db import accounts_collection, loans_collection, rollups_collection
+from . import leases
+
+# The admin dashboard reads one pre-aggregated document instead of scanning
+# accounts and loans on every page load. It is kept current two ways:
+#   - balance changes (deposits, withdrawals, transfers) are recorded as deltas
+#     in memory and applied to the accounts section with one $inc per refresh,
+#     so money movement never triggers a scan;
+#   - structural changes (accounts created or blocked, any loan write) mark the
+#     section dirty and it is recomputed by its $facet pipeline.
+# Recomputes run on one worker at a time under a lease in job_checkpoints.
+# A worker whose dirty mark is older than the stored refreshed_at drops it
+# without recomputing, and every section is rebuilt once ROLLUP_MAX_AGE_SECONDS
+# old, which also corrects any drift from deltas lost in a crash or applied
+# while a recompute was running.
+ROLLUP_ID = "portfolio"
+CHECKPOINT_ID = "dashboard_rollups"
+DASHBOARD_REFRESH_SECONDS = float(os.getenv("DASHBOARD_REFRESH_SECONDS", "60"))
+ROLLUP_MAX_AGE_SECONDS = float(os.getenv("ROLLUP_MAX_AGE_SECONDS", "900"))
+LEASE_SECONDS = 300
+
+ACTIVE_LOAN_STATUSES = ["Approved", "Ongoing"]
+
+# section -> when this worker first marked it dirty since it was last rebuilt
+_dirty = {}
+_balance_deltas = {}
+
+
+def mark_dirty(section: str):
+    """
+    Cheap in-memory flag set by structural write paths; the refresher picks it up
+    """
+    _dirty.setdefault(section, datetime.utcnow())
+
+
+def record_balance_change(account: dict, delta: float):
+    """
+    Queue a balance change of `account` for the next refresh; account needs status and account_type
+    """
+    for key in (
+        f"sections.accounts.by_status.{account.get('status')}.balance",
+        f"sections.accounts.by_type.{account.get('account_type')}.balance",
+        "sections.accounts.totals.total_deposits",
+    ):
+        _balance_deltas[key] = _balance_deltas.get(key, 0) + delta
+
+
+async def flush_balance_deltas() -> int:
+    global _balance_deltas
+    if not _balance_deltas:
+        return 0
+    deltas, _balance_deltas = _balance_deltas, {}
+    # until the section has been computed once there is nothing to adjust; the first build counts it all
+    await rollups_collection.update_one(
+        {"_id": ROLLUP_ID, "sections.accounts": {"$exists": True}}, {"$inc": deltas}
+    )
+    return len(deltas)
+
+
+def _month_bounds(now: datetime):
+    start = datetime(now.year, now.month, 1)
+    end = datetime(now.year + (now.month == 12), now.month % 12 + 1, 1)
+    return start, end
+
+
+def _accounts_pipeline():
+    return [
+        {"$facet": {
+            "by_status": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}, "balance": {"$sum": "$balance"}}},
+            ],
+            "by_type": [
+                {"$group": {"_id": "$account_type", "count": {"$sum": 1}, "balance": {"$sum": "$balance"}}},
+            ],
+            "totals": [
+                {"$group": {"_id": None, "accounts": {"$sum": 1}, "total_deposits": {"$sum": "$balance"}}},
+            ],
+        }},
+    ]
+
+
+# outstanding principal after k = n - remaining payments, reducing balance:
+#   P * ((1+r)^n - (1+r)^k) / ((1+r)^n - 1), or P * remaining / n when r == 0
+_OUTSTANDING_PRINCIPAL = {
+    "$let": {
+        "vars": {
+            "p": {"$ifNull": ["$amount", 0]},
+            "r": {"$divide": [{"$ifNull": ["$interest_rate", 0]}, 1200]},
+            "n": {"$max": [{"$ifNull": ["$duration_months", 1]}, 1]},
+            "left": {"$ifNull": ["$remaining_months", {"$ifNull": ["$duration_months", 0]}]},
+        },
+        "in": {"$cond": [
+            {"$eq": ["$$r", 0]},
+            {"$divide": [{"$multiply": ["$$p", "$$left"]}, "$$n"]},
+            {"$divide": [
+                {"$multiply": ["$$p", {"$subtract": [
+                    {"$pow": [{"$add": [1, "$$r"]}, "$$n"]},
+                    {"$pow": [{"$add": [1, "$$r"]}, {"$subtract": ["$$n", "$$left"]}]},
+                ]}]},
+                {"$subtract": [{"$pow": [{"$add": [1, "$$r"]}, "$$n"]}, 1]},
+            ]},
+        ]},
+    }
+}
+
+
+def _loans_pipeline(now: datetime):
+    month_start, month_end = _month_bounds(now)
+    return [
+        {"$facet": {
+            "by_status": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}},
+            ],
+            "by_scheme": [
+                {"$group": {
+                    "_id": {"$ifNull": ["$scheme_name", "Personalized"]},
+                    "count": {"$sum": 1},
+                    "amount": {"$sum": "$amount"},
+                }},
+            ],
+            "outstanding": [
+                {"$match": {"status": {"$in": ACTIVE_LOAN_STATUSES}}},
+                {"$group": {"_id": None, "loans": {"$sum": 1}, "principal": {"$sum": _OUTSTANDING_PRINCIPAL}}},
+            ],
+            "emis_due_this_month": [
+                {"$match": {
+                    "status": {"$in": ACTIVE_LOAN_STATUSES},
+                    "next_due_date": {"$gte": month_start, "$lt": month_end},
+                }},
+                {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$emi_amount"}}},
+            ],
+        }},
+    ]
+
+
+def _as_map(rows, *fields) -> dict:
+    return {
+        str(row["_id"]): {field: round(row[field], 2) if isinstance(row[field], float) else row[field] for field in fields}
+        for row in rows
+    }
+
+
+def _first(rows, default: dict) -> dict:
+    row = dict(rows[0]) if rows else dict(default)
+    row.pop("_id", None)
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()}
+
+
+async def _accounts_section(now: datetime) -> dict:
+    facet = (await accounts_collection.aggregate(_accounts_pipeline()).to_list(1))[0]
+    return {
+        "by_status": _as_map(facet["by_status"], "count", "balance"),
+        "by_type": _as_map(facet["by_type"], "count", "balance"),
+        "totals": _first(facet["totals"], {"accounts": 0, "total_deposits": 0.0}),
+    }
+
+
+async def _loans_section(now: datetime) -> dict:
+    facet = (await loans_collection.aggregate(_loans_pipeline(now)).to_list(1))[0]
+    return {
+        "by_status": _as_map(facet["by_status"], "count", "amount"),
+        "by_scheme": _as_map(facet["by_scheme"], "count", "amount"),
+        "outstanding": _first(facet["outstanding"], {"loans": 0, "principal": 0.0}),
+        "emis_due_this_month": _first(facet["emis_due_this_month"], {"count": 0, "amount": 0.0}),
+    }
+
+
+SECTIONS = {
+    "accounts": _accounts_section,
+    "loans": _loans_section,
+}
+
+
+async def refresh_rollups(force: bool = False) -> list:
+    """
+    Apply queued balance deltas, then recompute the sections that are dirty or stale; returns their names
+    """
+    await flush_balance_deltas()
+
+    now = datetime.utcnow()
+    rollup = await rollups_collection.find_one({"_id": ROLLUP_ID}, {"refreshed_at": 1}) or {}
+    refreshed = rollup.get("refreshed_at", {})
+    for name, marked_at in list(_dirty.items()):
+        if name in refreshed and refreshed[name] >= marked_at:
+            del _dirty[name]    # another worker's rebuild already covered this change
+
+    due = [
+        name for name in SECTIONS
+        if force or name in _dirty or name not in refreshed
+        or (now - refreshed[name]).total_seconds() > ROLLUP_MAX_AGE_SECONDS
+    ]
+    if not due or await leases.acquire(CHECKPOINT_ID, now, LEASE_SECONDS) is None:
+        return []
+
+    update = {}
+    try:
+        for name in due:
+            # forget the mark first so writes that land during the aggregation re-mark it
+            marked_at = _dirty.pop(name, None)
+            try:
+                update[f"sections.{name}"] = await SECTIONS[name](now)
+            except Exception:
+                if marked_at:
+                    _dirty.setdefault(name, marked_at)
+                raise
+            update[f"refreshed_at.{name}"] = now
+        await rollups_collection.update_one({"_id": ROLLUP_ID}, {"$set": update}, upsert=True)
+    finally:
+        await leases.release(CHECKPOINT_ID)
+    return due
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: _rounded(v) for k, v in value.items()}
+    return value
+
+
+async def get_dashboard(refresh: bool = False) -> dict:
+    if refresh:
+        await refresh_rollups(force=True)
+
+    rollup = await rollups_collection.find_one({"_id": ROLLUP_ID})
+    if not rollup or set(SECTIONS) - set(rollup.get("sections", {})):
+        await refresh_rollups(force=True)
+        rollup = await rollups_collection.find_one({"_id": ROLLUP_ID}) or {}
+
+    rollup.pop("_id", None)
+    # deltas accumulate float noise between rebuilds
+    return _rounded(rollup)
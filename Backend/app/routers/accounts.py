@@ -1,170 +1,346 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Header, Request
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
+import csv
+import io
 from pydantic import BaseModel
 from datetime import datetime
 from ..auth import get_current_user
-from ..db import accounts_collection, transactions_collection
-from ..utils import serialize_account
-from ..models import TransferRequest,WithdrawRequest,DepositRequest
+from ..db import payment_batches_collection
+from ..utils import serialize_account, encode_cursor, decode_cursor
+from ..serializers import MongoJSONResponse, encode_transaction
+from ..ledger import apply_deposit, apply_withdraw, transfer_funds, apply_payment_batch
+from ..models import TransferRequest,WithdrawRequest,DepositRequest,TransactionFilter,BatchTransferRequest
+from ..snapshots import balance_at, naive_utc
+from .. import txn_store
+from ..idempotency import run_idempotent
+from ..hot_accounts import hot_registry, transfer_to_hot_account
+from ..versions import not_modified, etag, etag_headers
+from ..statements import statement_chunks, balance_before, STATEMENT_FORMATS, STATEMENT_PROJECTION
 
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
 # View account details-----------------------
 @router.get("/me")
-async def view_account(current_account: dict = Depends(get_current_user)):
-    return {"account_details": serialize_account(current_account)}
+async def view_account(request: Request, current_account: dict = Depends(get_current_user)):
+    """
+    ETag follows the account's version; If-None-Match is answered from the cached principal
+    """
+    tag = etag("account", current_account["_id"], current_account.get("version", 0))
+    return not_modified(request, tag) or MongoJSONResponse(
+        {"account_details": serialize_account(current_account)}, headers=etag_headers(tag)
+    )
 
 
 
 # Deposit money into account-----------------------
 @router.post("/deposit")
-async def deposit_money(deposit: DepositRequest, current_account: dict = Depends(get_current_user)):
+async def deposit_money(
+    deposit: DepositRequest,
+    current_account: dict = Depends(get_current_user),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key")
+):
     if deposit.amount <= 0:
         raise HTTPException(status_code=400, detail="Deposit amount must be positive")
 
-    new_balance = round(current_account["balance"] + deposit.amount, 2)
-    await accounts_collection.update_one(
-        {"_id": current_account["_id"]},
-        {"$set": {"balance": new_balance}}
-    )
-
-    transaction = {
-    "account_id": str(current_account["_id"]),  
-    "type": "deposit",
-    "amount": deposit.amount,
-    "balance_after": new_balance,
-    "timestamp": datetime.utcnow()
-}
-    await transactions_collection.insert_one(transaction)
-
+    async def _deposit():
+        updated_account = await apply_deposit(current_account["_id"], deposit.amount)
+        if not updated_account:
+            raise HTTPException(status_code=404, detail="Account not found")
 
-    updated_account = await accounts_collection.find_one({"_id": current_account["_id"]})
+        return {
+            "message": f"Successfully deposited {deposit.amount}",
+            "new_balance": updated_account["balance"],
+            "account": serialize_account(updated_account)
+        }
 
-    return {
-        "message": f"Successfully deposited {deposit.amount}",
-        "new_balance": updated_account["balance"],
-        "account": serialize_account(updated_account)
-    }
+    return await run_idempotent(idempotency_key, current_account, "deposit", deposit.dict(), _deposit)
 
 
 
 @router.post("/withdraw")
-async def withdraw_money(withdraw: WithdrawRequest, current_account: dict = Depends(get_current_user)):
+async def withdraw_money(
+    withdraw: WithdrawRequest,
+    current_account: dict = Depends(get_current_user),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key")
+):
     if withdraw.amount <= 0:
         raise HTTPException(status_code=400, detail="Withdraw amount must be positive")
 
-    if withdraw.amount > current_account["balance"]:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
-    new_balance = round(current_account["balance"] - withdraw.amount, 2)
-    await accounts_collection.update_one(
-        {"_id": current_account["_id"]},
-        {"$set": {"balance": new_balance}}
-    )
-    transaction = {
-        "account_id": str(current_account["_id"]),
-        "type": "withdraw",
-        "amount": withdraw.amount,
-        "balance_after": new_balance,
-        "timestamp": datetime.utcnow()
-    }
-    await transactions_collection.insert_one(transaction)
+    async def _withdraw():
+        updated_account = await apply_withdraw(current_account["_id"], withdraw.amount)
+        if not updated_account:
+            if current_account.get("status", "active") != "active":
+                raise HTTPException(status_code=403, detail="Account is not active")
+            raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    updated_account = await accounts_collection.find_one({"_id": current_account["_id"]})
+        return {
+            "message": f"Successfully withdrew {withdraw.amount}",
+            "new_balance": updated_account["balance"],
+            "account": serialize_account(updated_account)
+        }
 
-    return {
-        "message": f"Successfully withdrew {withdraw.amount}",
-        "new_balance": updated_account["balance"],
-        "account": serialize_account(updated_account)
-    }
+    return await run_idempotent(idempotency_key, current_account, "withdraw", withdraw.dict(), _withdraw)
     
 
     
 # Transfer money to another account----------------------
 @router.post("/transfer")
-async def transfer_money(transfer: TransferRequest, current_account: dict = Depends(get_current_user)):
+async def transfer_money(
+    transfer: TransferRequest,
+    current_account: dict = Depends(get_current_user),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key")
+):
     if transfer.amount <= 0:
         raise HTTPException(status_code=400, detail="Transfer amount must be positive")
 
-    if transfer.amount > current_account["balance"]:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
-    receiver = await accounts_collection.find_one({"account_number": transfer.receiver_account_number})
-    if not receiver:
-        raise HTTPException(status_code=404, detail="Receiver account not found")
-
-    if str(receiver["_id"]) == str(current_account["_id"]):
+    if transfer.receiver_account_number == current_account["account_number"]:
         raise HTTPException(status_code=400, detail="Cannot transfer money to your own account")
 
-    new_sender_balance = round(current_account["balance"] - transfer.amount, 2)
-    await accounts_collection.update_one(
-        {"_id": current_account["_id"]},
-        {"$set": {"balance": new_sender_balance}}
+    async def _transfer():
+        hot_receiver_id = hot_registry.lookup(transfer.receiver_account_number)
+        if hot_receiver_id is not None:
+            # credit is applied by the hot-account flusher within HOT_FLUSH_INTERVAL_SECONDS
+            updated_sender = await transfer_to_hot_account(
+                current_account["_id"], hot_receiver_id, transfer.receiver_account_number, transfer.amount
+            )
+            receiver_balance, credit_status = None, "pending"
+        else:
+            updated_sender, receiver = await transfer_funds(
+                current_account["_id"], transfer.receiver_account_number, transfer.amount
+            )
+            receiver_balance, credit_status = receiver["balance"], "applied"
+
+        return {
+            "message": f"Successfully transferred {transfer.amount} to account {transfer.receiver_account_number}",
+            "sender_new_balance": updated_sender["balance"],
+            "receiver_new_balance": receiver_balance,
+            "credit_status": credit_status,
+            "sender_account": serialize_account(updated_sender)
+        }
+
+    return await run_idempotent(idempotency_key, current_account, "transfer", transfer.dict(), _transfer)
+
+# Bulk payments-----------------------
+MAX_BATCH_ROWS = 5000
+
+
+async def run_payment_batch_job(job_id: ObjectId, sender: dict, payments: list):
+    await payment_batches_collection.update_one(
+        {"_id": job_id}, {"$set": {"status": "processing", "started_at": datetime.utcnow()}}
     )
-
-    new_receiver_balance = round(receiver["balance"] + transfer.amount, 2)
-    await accounts_collection.update_one(
-        {"_id": receiver["_id"]},
-        {"$set": {"balance": new_receiver_balance}}
-    )
-
-    sender_transaction = {
-        "account_id": str(current_account["_id"]),
-        "type": "transfer_sent",
-        "amount": transfer.amount,
-        "balance_after": new_sender_balance,
-        "to_account": transfer.receiver_account_number,
-        "timestamp": datetime.utcnow()
-    }
-    await transactions_collection.insert_one(sender_transaction)
-
-    receiver_transaction = {
-        "account_id": str(receiver["_id"]),
-        "type": "transfer_received",
-        "amount": transfer.amount,
-        "balance_after": new_receiver_balance,
-        "from_account": current_account["account_number"],
-        "timestamp": datetime.utcnow()
+    try:
+        report = await apply_payment_batch(sender, payments, batch_id=job_id)
+        update = {"status": report["status"], "report": report}
+    except Exception as e:
+        update = {"status": "error", "error": str(e)}
+    update["finished_at"] = datetime.utcnow()
+    await payment_batches_collection.update_one({"_id": job_id}, {"$set": update})
+
+
+async def submit_payment_batch(payments: list, run_async: bool, background_tasks: BackgroundTasks, current_account: dict):
+    if not run_async:
+        return MongoJSONResponse(await apply_payment_batch(current_account, payments))
+
+    job = {
+        "sender_id": str(current_account["_id"]),
+        "status": "queued",
+        "total_rows": len(payments),
+        "created_at": datetime.utcnow(),
     }
-    await transactions_collection.insert_one(receiver_transaction)
-
-    updated_sender = await accounts_collection.find_one({"_id": current_account["_id"]})
+    result = await payment_batches_collection.insert_one(job)
+    background_tasks.add_task(run_payment_batch_job, result.inserted_id, current_account, payments)
+    return MongoJSONResponse({"batch_id": str(result.inserted_id), "status": "queued", "total_rows": len(payments)})
+
+
+@router.post("/transfer/batch")
+async def transfer_batch(
+    batch: BatchTransferRequest,
+    background_tasks: BackgroundTasks,
+    run_async: bool = False,
+    current_account: dict = Depends(get_current_user)
+):
+    """
+    Pay many receivers at once; with run_async=true a job id is returned immediately
+    """
+    payments = [p.dict() for p in batch.payments]
+    return await submit_payment_batch(payments, run_async, background_tasks, current_account)
+
+
+@router.post("/transfer/batch/upload")
+async def transfer_batch_upload(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    run_async: bool = True,
+    current_account: dict = Depends(get_current_user)
+):
+    """
+    CSV with a header row: receiver_account_number,amount
+    """
+    text = (await file.read()).decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or not {"receiver_account_number", "amount"} <= set(reader.fieldnames):
+        raise HTTPException(status_code=400, detail="CSV must have receiver_account_number and amount columns")
+
+    payments, bad_lines = [], []
+    for line, row in enumerate(reader, start=2):
+        try:
+            payments.append({
+                "receiver_account_number": row["receiver_account_number"].strip(),
+                "amount": float(row["amount"]),
+            })
+        except (TypeError, ValueError, AttributeError):
+            bad_lines.append(line)
+
+    if bad_lines:
+        raise HTTPException(status_code=400, detail=f"Malformed rows on lines {bad_lines[:20]}")
+    if not payments or len(payments) > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=400, detail=f"A batch must contain 1 to {MAX_BATCH_ROWS} payments")
+
+    return await submit_payment_batch(payments, run_async, background_tasks, current_account)
+
+
+@router.get("/transfer/batch/{batch_id}")
+async def get_transfer_batch(batch_id: str, current_account: dict = Depends(get_current_user)):
+    try:
+        job_id = ObjectId(batch_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid batch ID")
+
+    job = await payment_batches_collection.find_one(
+        {"_id": job_id, "sender_id": str(current_account["_id"])}
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch not found")
 
-    return {
-        "message": f"Successfully transferred {transfer.amount} to account {transfer.receiver_account_number}",
-        "sender_new_balance": updated_sender["balance"],
-        "receiver_new_balance": new_receiver_balance,
-        "sender_account": serialize_account(updated_sender)
-    }
+    job["batch_id"] = str(job.pop("_id"))
+    return MongoJSONResponse(job)
 
 # transaction history-----------------------
+TRANSACTION_PROJECTION = {
+    "type": 1, "amount": 1, "balance_after": 1, "timestamp": 1, "to_account": 1, "from_account": 1,
+    "credit_status": 1,
+}
 
-@router.get("/transactions")
-async def get_transaction_history(current_account: dict = Depends(get_current_user)):
-    if not current_account:
-        raise HTTPException(status_code=404, detail="Account not found")
 
-    account_id = str(current_account["_id"])
+def transaction_query(account_id: str, filters: TransactionFilter) -> dict:
+    query = {"account_id": account_id}
 
-    cursor = transactions_collection.find({"account_id": account_id}).sort("timestamp", -1)
+    if filters.start_date or filters.end_date:
+        query["timestamp"] = {}
+        if filters.start_date:
+            query["timestamp"]["$gte"] = filters.start_date
+        if filters.end_date:
+            query["timestamp"]["$lte"] = filters.end_date
 
-    transactions = []
-    async for txn in cursor:
-        txn["_id"] = str(txn["_id"])
+    if filters.type:
+        query["type"] = filters.type
 
-        if "amount" in txn:
-            txn["amount"] = round(float(txn["amount"]), 2)
-        if "balance_after" in txn:
-            txn["balance_after"] = round(float(txn["balance_after"]), 2)
+    if filters.min_amount is not None or filters.max_amount is not None:
+        query["amount"] = {}
+        if filters.min_amount is not None:
+            query["amount"]["$gte"] = filters.min_amount
+        if filters.max_amount is not None:
+            query["amount"]["$lte"] = filters.max_amount
 
-        if "timestamp" in txn and isinstance(txn["timestamp"], datetime):
-            txn["timestamp"] = txn["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+    return query
 
-        transactions.append(txn)
 
-    return {
+@router.get("/transactions")
+async def get_transaction_history(
+    filters: TransactionFilter = Depends(),
+    current_account: dict = Depends(get_current_user)
+):
+    """
+    Newest-first keyset pagination on (timestamp, _id); pass next_cursor back as cursor
+    """
+    query = transaction_query(str(current_account["_id"]), filters)
+
+    if filters.cursor:
+        try:
+            last_ts, last_id = decode_cursor(filters.cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"timestamp": {"$lt": last_ts}},
+            {"timestamp": last_ts, "_id": {"$lt": last_id}},
+        ]
+
+    # one extra row tells us whether another page exists
+    rows = await txn_store.find_newest(query, TRANSACTION_PROJECTION, filters.limit + 1)
+
+    next_cursor = None
+    if len(rows) > filters.limit:
+        rows = rows[:filters.limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["_id"])
+
+    return MongoJSONResponse({
         "account_number": current_account["account_number"],
-        "total_transactions": len(transactions),
-        "transactions": transactions
-    }
+        "count": len(rows),
+        "next_cursor": next_cursor,
+        "transactions": [encode_transaction(txn) for txn in rows]
+    })
 
+
+# point-in-time balance-----------------------
+@router.get("/balance-at")
+async def get_balance_at(at: datetime, current_account: dict = Depends(get_current_user)):
+    """
+    Account balance as it stood at `at` (UTC)
+    """
+    at = naive_utc(at)
+    result = await balance_at(current_account, at)
+    return MongoJSONResponse({"account_number": current_account["account_number"], "at": at, **result})
+
+
+# statement export-----------------------
+async def opening_balance_for(current_account: dict, start_date: datetime | None) -> float:
+    account_id = str(current_account["_id"])
+
+    if start_date:
+        previous = await txn_store.find_one_newest(
+            {"account_id": account_id, "timestamp": {"$lt": start_date}}, {"balance_after": 1}
+        )
+        if previous:
+            return round(float(previous["balance_after"]), 2)
+
+    first = await txn_store.find_one_oldest(
+        {"account_id": account_id, **({"timestamp": {"$gte": start_date}} if start_date else {})},
+        {"type": 1, "amount": 1, "balance_after": 1},
+    )
+    if first:
+        return balance_before(first)
+
+    return round(float(current_account["balance"]), 2)
+
+
+@router.get("/statement")
+async def export_statement(
+    format: str = "csv",
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    include_opening_balance: bool = True,
+    current_account: dict = Depends(get_current_user)
+):
+    """
+    Stream the account's transactions oldest-first as CSV or NDJSON
+    """
+    if format not in STATEMENT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(STATEMENT_FORMATS)}")
+
+    filters = TransactionFilter(start_date=start_date, end_date=end_date)
+    query = transaction_query(str(current_account["_id"]), filters)
+
+    opening_balance = None
+    if include_opening_balance:
+        opening_balance = await opening_balance_for(current_account, start_date)
+
+    rows = txn_store.iter_oldest(query, STATEMENT_PROJECTION)
+
+    filename = f"statement_{current_account['account_number']}.{format}"
+    return StreamingResponse(
+        statement_chunks(rows, format, opening_balance),
+        media_type=STATEMENT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,98 @@
+from contextlib import aclosing
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from ..auth import get_current_user
+from ..events import event_bus, EVENT_HEARTBEAT_SECONDS
+from ..serializers import dumps
+
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+# EventSource and browser WebSockets cannot send an Authorization header, so both
+# endpoints also accept the access token as ?token=
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login", auto_error=False)
+
+
+async def get_stream_user(bearer: str | None = Depends(optional_oauth2_scheme), token: str | None = None):
+    if not (bearer or token):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_current_user(bearer or token)
+
+
+def hello_event(account: dict) -> dict:
+    return {
+        "type": "hello",
+        "account_number": account["account_number"],
+        "balance": round(float(account["balance"]), 2),
+        "status": account.get("status"),
+    }
+
+
+async def account_events(account: dict):
+    """
+    hello, then the account's events as they are published, with a keepalive
+    whenever the feed has been quiet for EVENT_HEARTBEAT_SECONDS
+    """
+    # subscribe before building hello so nothing published in between is missed
+    subscription = event_bus.subscribe(account["_id"])
+    try:
+        yield hello_event(account)
+        while True:
+            event = await subscription.next(EVENT_HEARTBEAT_SECONDS)
+            if subscription.overflowed:
+                # events were dropped for this slow reader; it should re-read its state
+                subscription.overflowed = False
+                yield {"type": "resync"}
+            yield event or {"type": "keepalive"}
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+def sse_frame(event: dict) -> bytes:
+    if event["type"] == "keepalive":
+        return b": keepalive\n\n"
+    frame = b"event: %s\ndata: %s\n\n" % (event["type"].encode(), dumps(event))
+    return b"id: %d\n%s" % (event["id"], frame) if "id" in event else frame
+
+
+async def sse_stream(account: dict):
+    yield b"retry: 3000\n\n"
+    # closed explicitly so the subscription goes away with the connection, not at GC
+    async with aclosing(account_events(account)) as events:
+        async for event in events:
+            yield sse_frame(event)
+
+
+# Server-sent events-----------------------
+@router.get("/stream")
+async def event_stream(current_account: dict = Depends(get_stream_user)):
+    """
+    Balance, transaction and loan-status changes of the caller as text/event-stream
+    """
+    return StreamingResponse(
+        sse_stream(current_account),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# WebSocket-----------------------
+@router.websocket("/ws")
+async def event_socket(websocket: WebSocket, token: str | None = None):
+    """
+    Same events as /events/stream, one JSON message each
+    """
+    try:
+        account = await get_current_user(token or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    try:
+        async with aclosing(account_events(account)) as events:
+            async for event in events:
+                await websocket.send_text(dumps(event).decode())
+    except WebSocketDisconnect:
+        pass
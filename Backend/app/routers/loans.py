@@ -1,16 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response, Header, Request
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from bson.decimal128 import Decimal128
 from bson import ObjectId
 from ..auth import get_current_user
-from ..db import accounts_collection, loans_collection, loan_schemes_collection
+from ..db import loans_collection, emi_history_collection
 from ..utils import serialize_account
 from pydantic import BaseModel, Field
 from ..utils import serialize_list, serialize_doc
 from ..models import LoanApplicationModel, CustomLoan
+from .. import amortization
+from ..rollups import mark_dirty
+from ..catalog import scheme_catalog
+from ..idempotency import run_idempotent, transaction
+from ..events import emit_loan
+from ..versions import versioned, touch_loans, not_modified, etag, etag_headers
+from ..serializers import MongoJSONResponse, encode_loan
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/loans", tags=["Loans"])
 
 # Loan Constants
@@ -24,6 +34,7 @@ LOAN_TYPES = {
 MIN_BALANCE = 5000
 LATE_PENALTY = 200
 DEFAULT_MONTHS = 3
+BILLING_CYCLE_DAYS = 30
 
 # Pydantic Models
 
@@ -49,10 +60,7 @@ def calculate_emi(principal, rate, tenure):
     """
     EMI formula: [P x R x (1+R)^N] / [(1+R)^N – 1]
     """
-    R = (rate / 100) / 12
-    N = tenure
-    emi = (principal * R * (1 + R) ** N) / ((1 + R) ** N - 1)
-    return round(emi, 2)
+    return round(float(amortization.emi(principal, rate, tenure)), 2)
 
 # Route: Apply for Loan
 
@@ -67,16 +75,13 @@ async def apply_for_loan(
     except:
         raise HTTPException(status_code=400, detail="Invalid scheme ID")
 
-    scheme = await loan_schemes_collection.find_one({"_id": scheme_obj_id})
+    scheme = await scheme_catalog.get(scheme_obj_id)
     if not scheme:
         raise HTTPException(status_code=404, detail="Loan scheme not found")
     if scheme.get("status") != "active":
         raise HTTPException(status_code=400, detail="This loan scheme is not active")
 
-    user_account = await accounts_collection.find_one({"_id": ObjectId(current_user["_id"])})
-    if not user_account:
-        raise HTTPException(status_code=404, detail="User account not found")
-
+    user_account = current_user
 
     if application.amount > scheme["max_amount"]:
         raise HTTPException(
@@ -93,23 +98,24 @@ async def apply_for_loan(
         "duration_months": application.duration_months,
         "interest_rate": scheme["interest_rate"],
         "status": "pending",
-        "applied_at": datetime.utcnow()
+        "applied_at": datetime.utcnow(),
+        "version": 1,
     }
 
-    result = await loans_collection.insert_one(loan_data)
-    created_loan = await loans_collection.find_one({"_id": result.inserted_id})
+    await loans_collection.insert_one(loan_data)     # sets loan_data["_id"]
+    await touch_loans(user_account["_id"])
+    mark_dirty("loans")
+    created_loan = loan_data
 
-    return {
+    return MongoJSONResponse({
         "message": "Loan application submitted successfully!",
         "loan": serialize_doc(created_loan)
-    }
+    })
 
 # custome loan apply
 @router.post("/custom-apply")
 async def custom_loan_apply(data: CustomLoan, current_user: dict = Depends(get_current_user)):
-    user_account = await accounts_collection.find_one({"_id": ObjectId(current_user["_id"])})
-    if not user_account:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_account = current_user
 
     loan_data = {
         "user_id": str(user_account["_id"]),
@@ -123,83 +129,85 @@ async def custom_loan_apply(data: CustomLoan, current_user: dict = Depends(get_c
         "status": "pending",
         "type": "Personalized",
         "created_at": datetime.utcnow(),
+        "version": 1,
     }
 
     await loans_collection.insert_one(loan_data)
-    return {"message": "Personalized loan request submitted successfully!"}
+    await touch_loans(user_account["_id"])
+    mark_dirty("loans")
+    return MongoJSONResponse({"message": "Personalized loan request submitted successfully!"})
 
 # Route: View My Loans
 
 @router.get("/my-loans")
-async def get_my_loans(current_user: dict = Depends(get_current_user)):
+async def get_my_loans(request: Request, current_user: dict = Depends(get_current_user)):
     """
     Fetch all loans applied by the current user (both scheme-based and personalized).
+    ETag follows the account's loans_version, so a match skips the loans query.
     """
-    try:
-        user_account = await accounts_collection.find_one({"_id": ObjectId(current_user["_id"])})
-        if not user_account:
-            raise HTTPException(status_code=404, detail="User account not found")
+    tag = etag("loans", current_user["_id"], current_user.get("loans_version", 0))
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
 
-        user_id = str(user_account["_id"])
+    try:
+        user_id = str(current_user["_id"])
 
         user_loans = await loans_collection.find({"user_id": user_id}).to_list(None)
 
-        for loan in user_loans:
-            loan["_id"] = str(loan["_id"])
-            if "created_at" in loan and isinstance(loan["created_at"], datetime):
-                loan["created_at"] = loan["created_at"].isoformat()
-
-        return {"loans": user_loans}
+        return MongoJSONResponse({"loans": [encode_loan(loan) for loan in user_loans]}, headers=etag_headers(tag))
 
-    except Exception as e:
-        print("Error fetching user loans:", e)
+    except Exception:
+        logger.exception("Error fetching user loans")
         raise HTTPException(status_code=500, detail="Failed to fetch user loans")
 
 # Route: Pay EMI
 @router.get("/active")
-async def get_active_loans(current_user: dict = Depends(get_current_user)):
+async def get_active_loans(request: Request, current_user: dict = Depends(get_current_user)):
     """
     Fetch all approved (active) loans for the logged-in user.
     """
-    try:
-        user_account = await accounts_collection.find_one(
-            {"_id": ObjectId(current_user["_id"])}
-        )
-        if not user_account:
-            raise HTTPException(status_code=404, detail="User account not found")
+    tag = etag("active-loans", current_user["_id"], current_user.get("loans_version", 0))
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
 
-        user_id = str(user_account["_id"])
+    try:
+        user_id = str(current_user["_id"])
 
         active_loans = await loans_collection.find({
             "user_id": user_id,
             "status": {"$in": ["Approved", "Ongoing"]}
         }).to_list(None)
 
+        now = datetime.utcnow()
+        active_loans = [encode_loan(loan) for loan in active_loans]
         for loan in active_loans:
-            loan["_id"] = str(loan["_id"])
-            if "next_due_date" in loan and isinstance(loan["next_due_date"], datetime):
-                loan["next_due_date"] = loan["next_due_date"].isoformat()
-            else:
-                loan["next_due_date"] = datetime.utcnow().isoformat()
+            if not isinstance(loan.get("next_due_date"), datetime):
+                loan["next_due_date"] = now
 
             loan.setdefault("emi_amount", round(loan["amount"] / max(loan.get("duration_months", 1), 1), 2))
             loan.setdefault("remaining_months", loan.get("duration_months", 0))
             loan.setdefault("total_amount", loan["amount"])
 
-        return {"active_loans": active_loans}
+        return MongoJSONResponse({"active_loans": active_loans}, headers=etag_headers(tag))
 
-    except Exception as e:
-        print("Error in /loans/active:", e)
+    except Exception:
+        logger.exception("Error in /loans/active")
         raise HTTPException(status_code=500, detail="Failed to fetch active loans")
 
 # pay emi------------------------
 @router.post("/pay-emi/{loan_id}")
-async def pay_emi(loan_id: str, current_user: dict = Depends(get_current_user)):
+async def pay_emi(
+    loan_id: str,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key")
+):
     """
     Process EMI payment for a given loan.
     Deducts one EMI, updates next due date, and marks loan 'Completed' when finished.
     """
-    try:
+    async def _pay():
         loan = await loans_collection.find_one({"_id": ObjectId(loan_id)})
         if not loan:
             raise HTTPException(status_code=404, detail="Loan not found")
@@ -214,7 +222,7 @@ async def pay_emi(loan_id: str, current_user: dict = Depends(get_current_user)):
         if remaining_months <= 0:
             raise HTTPException(status_code=400, detail="Loan already paid off")
 
-        next_due_date = datetime.utcnow() + timedelta(days=30)
+        next_due_date = datetime.utcnow() + timedelta(days=BILLING_CYCLE_DAYS)
         updated_months = remaining_months - 1
 
         update_data = {
@@ -223,18 +231,26 @@ async def pay_emi(loan_id: str, current_user: dict = Depends(get_current_user)):
             "status": "Ongoing" if updated_months > 0 else "Completed",
         }
 
-        await loans_collection.update_one(
-            {"_id": ObjectId(loan_id)},
-            {"$set": update_data}
-        )
-
         emi_record = {
             "loan_id": str(loan["_id"]),
             "amount_paid": loan.get("emi_amount", 0),
             "paid_on": datetime.utcnow(),
             "user_id": str(current_user["_id"]),
         }
-        await loans_collection.database["emi_history"].insert_one(emi_record)
+
+        async def _record(session):
+            await loans_collection.update_one(
+                {"_id": ObjectId(loan_id)},
+                versioned({"$set": update_data}),
+                session=session,
+            )
+            await touch_loans(current_user["_id"], session=session)
+            await emi_history_collection.insert_one(emi_record, session=session)
+
+        # with an Idempotency-Key these commit together with the key's applied marker
+        await transaction(_record, required=False)
+        mark_dirty("loans")
+        emit_loan(current_user["_id"], loan_id, update_data["status"], remaining_months=updated_months)
 
         return {
             "message": "EMI payment successful!",
@@ -242,10 +258,12 @@ async def pay_emi(loan_id: str, current_user: dict = Depends(get_current_user)):
             "next_due_date": next_due_date.isoformat(),
         }
 
+    try:
+        return await run_idempotent(idempotency_key, current_user, "pay-emi", {"loan_id": loan_id}, _pay)
     except HTTPException:
         raise
-    except Exception as e:
-        print("Error in /loans/pay-emi:", e)
+    except Exception:
+        logger.exception("Error in /loans/pay-emi")
         raise HTTPException(status_code=500, detail="Failed to process EMI payment")
 
 # pay advance emi------------------------
@@ -269,7 +287,7 @@ async def pay_advance(loan_id: str, current_user: dict = Depends(get_current_use
         if remaining_months <= 0:
             raise HTTPException(status_code=400, detail="Loan already fully paid")
 
-        next_due_date = datetime.utcnow() + timedelta(days=30)
+        next_due_date = datetime.utcnow() + timedelta(days=BILLING_CYCLE_DAYS)
         updated_months = remaining_months - 1
 
         update_data = {
@@ -278,7 +296,8 @@ async def pay_advance(loan_id: str, current_user: dict = Depends(get_current_use
             "status": "Ongoing" if updated_months > 0 else "Completed",
         }
 
-        await loans_collection.update_one({"_id": ObjectId(loan_id)}, {"$set": update_data})
+        await loans_collection.update_one({"_id": ObjectId(loan_id)}, versioned({"$set": update_data}))
+        await touch_loans(current_user["_id"])
 
         emi_record = {
             "loan_id": str(loan["_id"]),
@@ -287,23 +306,57 @@ async def pay_advance(loan_id: str, current_user: dict = Depends(get_current_use
             "paid_on": datetime.utcnow(),
             "payment_type": "Advance",
         }
-        await loans_collection.database["emi_history"].insert_one(emi_record)
+        await emi_history_collection.insert_one(emi_record)
+        mark_dirty("loans")
+        emit_loan(current_user["_id"], loan_id, update_data["status"], remaining_months=updated_months)
 
-        return {
+        return MongoJSONResponse({
             "message": "Advance EMI paid successfully!",
             "remaining_months": updated_months,
             "next_due_date": next_due_date.isoformat(),
-        }
+        })
 
-    except Exception as e:
-        print("Error in pay_advance:", e)
+    except Exception:
+        logger.exception("Error in pay_advance")
         raise HTTPException(status_code=500, detail="Failed to process advance EMI payment")
 
+@router.get("/{loan_id}/schedule")
+async def get_loan_schedule(loan_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Month-by-month principal / interest / balance schedule of one of the user's loans
+    """
+    try:
+        obj_id = ObjectId(loan_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid loan ID")
+
+    loan = await loans_collection.find_one(
+        {"_id": obj_id},
+        {"user_id": 1, "amount": 1, "interest_rate": 1, "duration_months": 1, "remaining_months": 1, "status": 1},
+    )
+    if not loan:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    if str(loan["user_id"]) != str(current_user["_id"]):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    months = int(loan.get("duration_months", 1))
+    result = amortization.loan_schedule(float(loan["amount"]), float(loan.get("interest_rate", 0)), months)
+
+    paid = months - int(loan.get("remaining_months", months))
+    for row in result["schedule"]:
+        row["paid"] = row["month"] <= paid
+
+    return MongoJSONResponse({"loan_id": loan_id, "status": loan.get("status"), **result})
+
+
 @router.get("/schemes")
-async def get_active_loan_schemes(current_user: dict = Depends(get_current_user)):
+async def get_active_loan_schemes(request: Request, current_user: dict = Depends(get_current_user)):
     """
-    Fetch all active loan schemes for users to view
+    Fetch all active loan schemes for users to view; ETag follows the catalog version
     """
-    schemes = await loan_schemes_collection.find({"status": "active"}).to_list(100)
-    return {"total_schemes": len(schemes), "loan_schemes": serialize_list(schemes)}
+    payload = await scheme_catalog.active_listing()
+    tag = etag("schemes", scheme_catalog.version)
+    return not_modified(request, tag) or Response(
+        content=payload, media_type="application/json", headers=etag_headers(tag)
+    )
 
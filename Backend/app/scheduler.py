@@ -0,0 +1,37 @@
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# name -> asyncio.Task of every periodic job started from the app lifespan
+_tasks = {}
+
+
+async def _run_every(name: str, interval_seconds: float, job):
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Periodic job %s failed", name)
+        await asyncio.sleep(interval_seconds)
+
+
+def start_periodic(name: str, interval_seconds: float, job):
+    """
+    Run `job()` now and then every interval_seconds until stop_all()
+    """
+    if name in _tasks and not _tasks[name].done():
+        return _tasks[name]
+    _tasks[name] = asyncio.create_task(_run_every(name, interval_seconds, job), name=name)
+    return _tasks[name]
+
+
+async def stop_all():
+    tasks = list(_tasks.values())
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
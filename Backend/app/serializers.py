@@ -0,0 +1,75 @@
+
+from datetime import datetime
+from decimal import Decimal
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi.responses import JSONResponse
+
+# Shape-specialized encoders: each one knows where the Mongo-only types sit in
+# its document, so nothing is walked recursively. Datetimes are left in place;
+# orjson writes them natively (ISO 8601), and mongo_default catches anything else.
+
+
+def _money(value) -> float:
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    return round(float(value), 2)
+
+
+def mongo_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (Decimal128, Decimal)):
+        return _money(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=mongo_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """
+    orjson-backed default response class; understands ObjectId and Decimal128
+    """
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def encode_account(account: dict) -> dict:
+    doc = dict(account)
+    if "_id" in doc:
+        doc["_id"] = str(doc["_id"])
+    customer = doc.get("customer")
+    if customer and "password" in customer:
+        doc["customer"] = {k: v for k, v in customer.items() if k != "password"}
+    return doc
+
+
+# hot-account bookkeeping on pending legs; never sent to clients
+INTERNAL_LEG_FIELDS = ("credit_owner", "credit_lease_until", "credit_claim")
+
+
+def encode_transaction(txn: dict) -> dict:
+    doc = {k: v for k, v in txn.items() if k not in INTERNAL_LEG_FIELDS}
+    doc["_id"] = str(doc["_id"])
+    if "amount" in doc:
+        doc["amount"] = _money(doc["amount"])
+    if "balance_after" in doc:
+        doc["balance_after"] = _money(doc["balance_after"])
+    timestamp = doc.get("timestamp")
+    if isinstance(timestamp, datetime):
+        doc["timestamp"] = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    return doc
+
+
+LOAN_MONEY_FIELDS = ("amount", "emi_amount", "total_amount", "penalty_due")
+
+
+def encode_loan(loan: dict) -> dict:
+    doc = dict(loan)
+    doc["_id"] = str(doc["_id"])
+    for field in LOAN_MONEY_FIELDS:
+        if isinstance(doc.get(field), (Decimal128, Decimal)):
+            doc[field] = _money(doc[field])
+    return doc
@@ -0,0 +1,213 @@
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from .db import (
+    accounts_collection,
+    transactions_collection,
+    balance_snapshots_collection,
+)
+from .statements import balance_before
+from . import leases, txn_store
+
+logger = logging.getLogger(__name__)
+
+# One end-of-day balance per account per day: {account_id, day, balance, transactions}.
+# A day is built from the previous day's snapshots plus that day's transactions, so
+# "balance at X" is an indexed snapshot read plus at most one day of deltas.
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "3600"))
+SNAPSHOT_CHUNK = int(os.getenv("SNAPSHOT_CHUNK", "1000"))
+CHECKPOINT_ID = "balance_snapshots"
+ONE_DAY = timedelta(days=1)
+LEASE_SECONDS = 600
+
+
+def day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """
+    Stored timestamps are naive UTC; convert an aware query parameter to match
+    """
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def _last_balances(account_ids: list, before: datetime, since: datetime | None = None) -> dict:
+    """
+    account_id -> (balance_after of its last transaction before `before`, count since `since`)
+    """
+    match = {"account_id": {"$in": account_ids}, "timestamp": {"$lt": before}}
+    if since:
+        match["timestamp"]["$gte"] = since
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"account_id": 1, "timestamp": -1, "_id": -1}},       # index order
+        {"$group": {"_id": "$account_id", "balance": {"$first": "$balance_after"}, "count": {"$sum": 1}}},
+    ]
+    found = {row["_id"]: (row["balance"], row["count"]) async for row in transactions_collection.aggregate(pipeline)}
+    if since is None:
+        # accounts whose whole history before `before` has been moved to the cold tiers
+        missing = [i for i in account_ids if i not in found]
+        if missing:
+            found.update({i: (b, 0) for i, b in (await txn_store.closing_balances(missing, before)).items()})
+    return found
+
+
+async def _opening_from_later(account_ids: list, after: datetime) -> dict:
+    """
+    For accounts with no history before `after`: the balance just before their first later transaction
+    """
+    pipeline = [
+        {"$match": {"account_id": {"$in": account_ids}, "timestamp": {"$gte": after}}},
+        {"$sort": {"account_id": -1, "timestamp": 1, "_id": 1}},        # index order, reversed
+        {"$group": {"_id": "$account_id", "first": {"$first": "$$ROOT"}}},
+    ]
+    return {row["_id"]: balance_before(row["first"]) async for row in transactions_collection.aggregate(pipeline)}
+
+
+async def build_day(day: datetime) -> int:
+    """
+    Upsert the end-of-day snapshot of every active account for `day`; safe to re-run
+    """
+    end = day + ONE_DAY
+    written = 0
+    last_id = None
+
+    while True:
+        query = {"status": "active", "created_at": {"$lt": end}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        accounts = await accounts_collection.find(query, {"balance": 1}) \
+            .sort("_id", 1).limit(SNAPSHOT_CHUNK).to_list(SNAPSHOT_CHUNK)
+        if not accounts:
+            break
+        last_id = accounts[-1]["_id"]
+
+        ids = [str(a["_id"]) for a in accounts]
+        todays = await _last_balances(ids, end, since=day)
+        previous = {
+            snap["account_id"]: snap["balance"]
+            async for snap in balance_snapshots_collection.find(
+                {"account_id": {"$in": ids}, "day": day - ONE_DAY}, {"account_id": 1, "balance": 1}
+            )
+        }
+
+        # first snapshot of an account with a quiet day: derive it from the ledger once
+        missing = [i for i in ids if i not in todays and i not in previous]
+        bootstrap = await _last_balances(missing, end) if missing else {}
+        still_missing = [i for i in missing if i not in bootstrap]
+        later = await _opening_from_later(still_missing, end) if still_missing else {}
+
+        ops = []
+        for account in accounts:
+            account_id = str(account["_id"])
+            if account_id in todays:
+                balance, count = todays[account_id]
+            elif account_id in previous:
+                balance, count = previous[account_id], 0
+            elif account_id in bootstrap:
+                balance, count = bootstrap[account_id][0], 0
+            else:
+                balance, count = later.get(account_id, account["balance"]), 0
+
+            ops.append(UpdateOne(
+                {"account_id": account_id, "day": day},
+                {"$set": {"balance": round(float(balance), 2), "transactions": count}},
+                upsert=True,
+            ))
+
+        await balance_snapshots_collection.bulk_write(ops, ordered=False)
+        written += len(ops)
+
+    return written
+
+
+async def run_snapshot_job() -> list:
+    """
+    Build every complete day since the last one built, oldest first
+    """
+    now = datetime.utcnow()
+    checkpoint = await leases.acquire(CHECKPOINT_ID, now, LEASE_SECONDS)
+    if checkpoint is None:
+        logger.info("Balance snapshots already being built elsewhere")
+        return []
+
+    today = day_start(now)
+    day = checkpoint["last_day"] + ONE_DAY if checkpoint.get("last_day") else today - ONE_DAY
+
+    built = []
+    try:
+        while day < today:
+            count = await build_day(day)
+            await leases.renew(CHECKPOINT_ID, LEASE_SECONDS, {"last_day": day, "updated_at": datetime.utcnow()})
+            logger.info("Balance snapshots for %s: %s accounts", day.date(), count)
+            built.append(day)
+            day += ONE_DAY
+    finally:
+        await leases.release(CHECKPOINT_ID)
+    return built
+
+
+# -------------------- Point-in-time reads --------------------
+async def balance_at(account: dict, at: datetime) -> dict:
+    """
+    Balance of `account` at `at`: today's deltas, else yesterday's snapshot, else the ledger
+    """
+    account_id = str(account["_id"])
+    at = naive_utc(at)
+    if at >= datetime.utcnow():
+        return {"balance": round(float(account["balance"]), 2), "source": "current"}
+
+    start = day_start(at)
+    last = await transactions_collection.find_one(
+        {"account_id": account_id, "timestamp": {"$gte": start, "$lte": at}},
+        {"balance_after": 1},
+        sort=[("timestamp", -1), ("_id", -1)],
+    )
+    if last:
+        return {"balance": round(float(last["balance_after"]), 2), "source": "transaction"}
+
+    snapshot = await balance_snapshots_collection.find_one({"account_id": account_id, "day": start - ONE_DAY})
+    if snapshot:
+        return {"balance": snapshot["balance"], "source": "snapshot", "snapshot_day": snapshot["day"]}
+
+    # no snapshot yet for that day: fall back to the ledger, cold tiers included
+    if account.get("created_at") and account["created_at"] > at:
+        return {"balance": 0.0, "source": "not_open"}
+    last = await txn_store.find_one_newest(
+        {"account_id": account_id, "timestamp": {"$lte": at}}, {"balance_after": 1}
+    )
+    if last:
+        return {"balance": round(float(last["balance_after"]), 2), "source": "transaction"}
+    first = await txn_store.find_one_oldest(
+        {"account_id": account_id, "timestamp": {"$gt": at}}, {"type": 1, "amount": 1, "balance_after": 1}
+    )
+    if first:
+        return {"balance": balance_before(first), "source": "transaction"}
+    return {"balance": round(float(account["balance"]), 2), "source": "current"}
+
+
+async def balances_on(day: datetime, after: str | None = None, limit: int = 1000) -> list:
+    """
+    End-of-day balances of all accounts for `day`, paged by account_id
+    """
+    query = {"day": day_start(naive_utc(day))}
+    if after:
+        query["account_id"] = {"$gt": after}
+    return await balance_snapshots_collection.find(query, {"_id": 0}) \
+        .sort("account_id", 1).limit(limit).to_list(limit)
+
+
+if __name__ == "__main__":
+    # python -m app.snapshots [YYYY-MM-DD]   (no date: catch up to yesterday)
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1:
+        asyncio.run(build_day(datetime.strptime(sys.argv[1], "%Y-%m-%d")))
+    else:
+        asyncio.run(run_snapshot_job())
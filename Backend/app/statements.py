@@ -0,0 +1,79 @@
+
+import csv
+import io
+import json
+from datetime import datetime
+
+STATEMENT_FIELDS = ["timestamp", "type", "amount", "balance_after", "to_account", "from_account"]
+STATEMENT_PROJECTION = {field: 1 for field in STATEMENT_FIELDS}
+STATEMENT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+CREDIT_TYPES = {"deposit", "transfer_received"}
+
+# rows are buffered into chunks so the socket sees a few large writes instead of
+# millions of tiny ones; memory stays bounded by the chunk size
+ROWS_PER_CHUNK = 500
+
+
+def signed_amount(txn: dict) -> float:
+    amount = float(txn.get("amount", 0))
+    return amount if txn.get("type") in CREDIT_TYPES else -amount
+
+
+def balance_before(txn: dict) -> float:
+    return round(float(txn["balance_after"]) - signed_amount(txn), 2)
+
+
+def _statement_row(txn: dict) -> dict:
+    timestamp = txn.get("timestamp")
+    return {
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "type": txn.get("type"),
+        "amount": round(float(txn.get("amount", 0)), 2),
+        "balance_after": round(float(txn.get("balance_after", 0)), 2),
+        "to_account": txn.get("to_account"),
+        "from_account": txn.get("from_account"),
+    }
+
+
+async def statement_chunks(rows, fmt: str, opening_balance: float | None = None):
+    """
+    Encode an async iterable of transactions as CSV or NDJSON chunks.
+    Nothing is read from `rows` until the consumer asks for the next chunk,
+    so a slow client throttles the database cursor instead of filling memory.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=STATEMENT_FIELDS) if fmt == "csv" else None
+
+    def write(row: dict):
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row))
+            buffer.write("\n")
+
+    def drain() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    if writer:
+        writer.writeheader()
+    if opening_balance is not None:
+        write({"timestamp": None, "type": "opening_balance", "amount": None,
+               "balance_after": opening_balance, "to_account": None, "from_account": None})
+
+    pending = 0
+    async for txn in rows:
+        write(_statement_row(txn))
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield drain()
+            pending = 0
+
+    tail = drain()
+    if tail:
+        yield tail
@@ -0,0 +1,269 @@
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne, UpdateOne
+from .db import (
+    accounts_collection,
+    transactions_collection,
+    transaction_buckets_collection,
+    transaction_archive_collection,
+    job_checkpoints_collection,
+)
+from .idempotency import transaction
+from . import leases
+from .statements import balance_before
+
+logger = logging.getLogger(__name__)
+
+# Moves history down the tiers described in app.txn_store:
+#   1. legs older than the start of the month TXN_FLAT_RETENTION_DAYS ago are
+#      grouped into buckets (per account, per month, at most TXN_BUCKET_MAX_ENTRIES)
+#      and deleted from the flat collection;
+#   2. buckets from before the month TXN_ARCHIVE_AFTER_DAYS ago move to the archive.
+#
+# A bucket's _id is the _id of its first leg. Each batch of bucket writes commits
+# in one transaction with the delete of its legs, so no reader sees a leg in both
+# tiers and a re-run never finds a leg that is already in a bucket.
+# Legs that reach the cutoff after their month was bucketed (a hot-account credit
+# that settled late) are merged into the bucket whose time range covers them,
+# never into a second bucket for the same window; such a bucket may run a few
+# entries past TXN_BUCKET_MAX_ENTRIES.
+# Progress is checkpointed per chunk of accounts and guarded by a lease, like the
+# overdue scan; an interrupted run resumes after the last finished chunk.
+TXN_TIERING_ENABLED = os.getenv("TXN_TIERING_ENABLED", "false").lower() == "true"
+TXN_TIERING_INTERVAL_SECONDS = float(os.getenv("TXN_TIERING_INTERVAL_SECONDS", "86400"))
+TXN_FLAT_RETENTION_DAYS = int(os.getenv("TXN_FLAT_RETENTION_DAYS", "60"))
+TXN_ARCHIVE_AFTER_DAYS = int(os.getenv("TXN_ARCHIVE_AFTER_DAYS", "365"))
+TXN_BUCKET_MAX_ENTRIES = int(os.getenv("TXN_BUCKET_MAX_ENTRIES", "200"))
+TXN_TIERING_CHUNK = int(os.getenv("TXN_TIERING_CHUNK", "200"))
+BUCKET_WRITE_BATCH = 100
+LEASE_SECONDS = 600
+
+CHECKPOINT_ID = "txn_tiering"
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def make_bucket(account_id: str, entries: list) -> dict:
+    first, last = entries[0], entries[-1]
+    return {
+        "_id": first["_id"],
+        "account_id": account_id,
+        "month": month_start(first["timestamp"]),
+        "first_ts": first["timestamp"],
+        "last_ts": last["timestamp"],
+        "count": len(entries),
+        "opening_balance": balance_before(first),
+        "closing_balance": round(float(last["balance_after"]), 2),
+        "entries": [{k: v for k, v in entry.items() if k != "account_id"} for entry in entries],
+    }
+
+
+def merge_into(bucket: dict, legs: list) -> UpdateOne:
+    """
+    Update that adds late legs to an existing bucket, keeping entries oldest first
+    """
+    entries = [{k: v for k, v in leg.items() if k != "account_id"} for leg in legs]
+    update = {
+        "$push": {"entries": {"$each": entries, "$sort": {"timestamp": 1, "_id": 1}}},
+        "$inc": {"count": len(legs)},
+        "$min": {"first_ts": legs[0]["timestamp"]},
+        "$max": {"last_ts": legs[-1]["timestamp"]},
+    }
+    if legs[0]["timestamp"] < bucket["first_ts"]:
+        update["$set"] = {"opening_balance": balance_before(legs[0])}
+    if legs[-1]["timestamp"] >= bucket["last_ts"]:
+        update.setdefault("$set", {})["closing_balance"] = round(float(legs[-1]["balance_after"]), 2)
+    return UpdateOne({"_id": bucket["_id"]}, update)
+
+
+async def _month_buckets(account_id: str, month: datetime) -> tuple:
+    """
+    (tier, buckets) already holding the account's legs of `month`, oldest first
+    """
+    for tier in (transaction_buckets_collection, transaction_archive_collection):
+        buckets = await tier.find(
+            {"account_id": account_id, "month": month}, {"first_ts": 1, "last_ts": 1}
+        ).sort("first_ts", 1).to_list(None)
+        if buckets:
+            return tier, buckets
+    return None, []
+
+
+def _late_merges(buckets: list, legs: list) -> list:
+    """
+    Spread late legs (oldest first) over the month's buckets by time range
+    """
+    groups = {}
+    for leg in legs:
+        # the last bucket that starts at or before the leg; earlier legs go to the first
+        target = buckets[0]
+        for bucket in buckets:
+            if bucket["first_ts"] <= leg["timestamp"]:
+                target = bucket
+        groups.setdefault(target["_id"], (target, []))[1].append(leg)
+    return [merge_into(bucket, group) for bucket, group in groups.values()]
+
+
+async def _write_buckets(buckets: list, merges: list) -> int:
+    """
+    Write new buckets and (tier, ops, leg ids) merges and delete their legs, in one transaction
+    """
+    moved = [entry["_id"] for b in buckets for entry in b["entries"]]
+    moved += [leg_id for _, _, leg_ids in merges for leg_id in leg_ids]
+    if not moved:
+        return 0
+
+    async def _move(session):
+        if buckets:
+            await transaction_buckets_collection.bulk_write(
+                [ReplaceOne({"_id": b["_id"]}, b, upsert=True) for b in buckets], ordered=False, session=session
+            )
+        for tier, ops, _ in merges:
+            await tier.bulk_write(ops, ordered=False, session=session)
+        await transactions_collection.delete_many({"_id": {"$in": moved}}, session=session)
+
+    await transaction(_move)
+    return len(moved)
+
+
+async def bucket_account(account_id: str, cutoff: datetime) -> tuple:
+    """
+    Fold one account's legs older than cutoff into buckets; returns (new buckets, legs moved)
+    """
+    # pending hot-account legs are still being updated by the flusher; they move on a later run
+    cursor = transactions_collection.find(
+        {"account_id": account_id, "timestamp": {"$lt": cutoff}, "credit_status": {"$ne": "pending"}}
+    ).sort([("timestamp", 1), ("_id", 1)]).batch_size(1000)
+
+    current, ready, merges = [], [], []
+    month = tier = None
+    existing = []
+    buckets = moved = 0
+
+    def close():
+        if current and existing:
+            merges.append((tier, _late_merges(existing, current), [leg["_id"] for leg in current]))
+        elif current:
+            ready.append(make_bucket(account_id, current))
+        current.clear()
+
+    async for leg in cursor:
+        leg_month = month_start(leg["timestamp"])
+        if leg_month != month:
+            close()
+            month = leg_month
+            tier, existing = await _month_buckets(account_id, month)
+        elif not existing and len(current) >= TXN_BUCKET_MAX_ENTRIES:
+            close()
+        current.append(leg)
+        if len(ready) + len(merges) >= BUCKET_WRITE_BATCH:
+            moved += await _write_buckets(ready, merges)
+            buckets += len(ready)
+            ready, merges = [], []
+
+    close()
+    moved += await _write_buckets(ready, merges)
+    buckets += len(ready)
+    return buckets, moved
+
+
+async def archive_buckets(archive_cutoff: datetime, chunk: int = 500) -> int:
+    """
+    Move buckets of months before archive_cutoff into the archive collection
+    """
+    archived = 0
+    while True:
+        buckets = await transaction_buckets_collection.find({"month": {"$lt": archive_cutoff}}) \
+            .sort([("month", 1), ("_id", 1)]).limit(chunk).to_list(chunk)
+        if not buckets:
+            return archived
+        await transaction_archive_collection.bulk_write(
+            [ReplaceOne({"_id": b["_id"]}, b, upsert=True) for b in buckets], ordered=False
+        )
+        await transaction_buckets_collection.delete_many({"_id": {"$in": [b["_id"] for b in buckets]}})
+        archived += len(buckets)
+
+
+async def _acquire(now: datetime, retention_days: int):
+    """
+    Take the tiering lease; resumes an unfinished run or starts a new one
+    """
+    checkpoint = await leases.acquire(CHECKPOINT_ID, now, LEASE_SECONDS, {"status": "completed"})
+    if checkpoint is None:
+        return None
+
+    if checkpoint.get("status") != "running":
+        checkpoint = {
+            "status": "running",
+            "cutoff": month_start(now - timedelta(days=retention_days)),
+            "archive_cutoff": month_start(now - timedelta(days=TXN_ARCHIVE_AFTER_DAYS)),
+            "started_at": now,
+            "last_account": None,
+            "accounts": 0,
+            "buckets": 0,
+            "moved": 0,
+            "archived": 0,
+        }
+        await job_checkpoints_collection.update_one({"_id": CHECKPOINT_ID}, {"$set": checkpoint})
+    return checkpoint
+
+
+async def run_tiering(retention_days: int = TXN_FLAT_RETENTION_DAYS) -> dict | None:
+    """
+    One resumable pass: bucket every account's old legs, then archive old buckets
+    """
+    checkpoint = await _acquire(datetime.utcnow(), retention_days)
+    if checkpoint is None:
+        logger.info("Transaction tiering already running elsewhere")
+        return None
+
+    cutoff = checkpoint["cutoff"]
+    while True:
+        query = {"_id": {"$gt": checkpoint["last_account"]}} if checkpoint["last_account"] else {}
+        accounts = await accounts_collection.find(query, {"_id": 1}) \
+            .sort("_id", 1).limit(TXN_TIERING_CHUNK).to_list(TXN_TIERING_CHUNK)
+        if not accounts:
+            break
+
+        for account in accounts:
+            buckets, moved = await bucket_account(str(account["_id"]), cutoff)
+            checkpoint["buckets"] += buckets
+            checkpoint["moved"] += moved
+
+        checkpoint["accounts"] += len(accounts)
+        checkpoint["last_account"] = accounts[-1]["_id"]
+        await leases.renew(CHECKPOINT_ID, LEASE_SECONDS, {
+            "last_account": checkpoint["last_account"],
+            "accounts": checkpoint["accounts"],
+            "buckets": checkpoint["buckets"],
+            "moved": checkpoint["moved"],
+        })
+        logger.info("Tiering: %s accounts, %s legs moved into %s buckets",
+                    checkpoint["accounts"], checkpoint["moved"], checkpoint["buckets"])
+
+    checkpoint["archived"] = await archive_buckets(checkpoint["archive_cutoff"])
+    checkpoint.update(status="completed", finished_at=datetime.utcnow())
+    await leases.release(CHECKPOINT_ID, {
+        "status": "completed",
+        "archived": checkpoint["archived"],
+        "finished_at": checkpoint["finished_at"],
+    })
+    logger.info("Tiering done: %s legs moved into %s buckets, %s buckets archived",
+                checkpoint["moved"], checkpoint["buckets"], checkpoint["archived"])
+    return checkpoint
+
+
+if __name__ == "__main__":
+    # python -m app.tiering [--retention-days N]
+    # migrates the existing flat collection; N=0 buckets every closed month.
+    # Safe to interrupt and re-run: it resumes from the last checkpointed chunk.
+    logging.basicConfig(level=logging.INFO)
+    argv = sys.argv[1:]
+    days = int(argv[argv.index("--retention-days") + 1]) if "--retention-days" in argv else TXN_FLAT_RETENTION_DAYS
+    asyncio.run(run_tiering(days))
@@ -0,0 +1,146 @@
+
+from datetime import datetime
+from .db import transactions_collection, transaction_buckets_collection, transaction_archive_collection
+
+# Transaction history lives in three tiers that never overlap in time:
+#   transactions         one document per leg, everything newer than the tiering cutoff
+#   transaction_buckets  older legs grouped per account into bucket documents
+#   transaction_archive  buckets older than TXN_ARCHIVE_AFTER_DAYS
+# A bucket holds up to TXN_BUCKET_MAX_ENTRIES legs of one month, oldest first,
+# with first_ts/last_ts, opening_balance and closing_balance alongside.
+# (see app.tiering for how legs move between tiers)
+#
+# Readers pass the same query they would run against the flat collection; the
+# cold tiers are read with an aggregation that unwinds matching buckets and
+# applies that query to the entries. Because the tiers are time-ordered, a
+# newest-first read walks flat -> buckets -> archive and stops once it has
+# enough rows, so recent pages never touch cold storage.
+NEWEST_FIRST = [("timestamp", -1), ("_id", -1)]
+OLDEST_FIRST = [("timestamp", 1), ("_id", 1)]
+
+COLD_TIERS = (transaction_buckets_collection, transaction_archive_collection)
+
+
+def _split(query: dict) -> tuple:
+    entry_query = {k: v for k, v in query.items() if k != "account_id"}
+    return query["account_id"], entry_query
+
+
+def _time_bounds(entry_query: dict) -> tuple:
+    lower = upper = None
+    ts = entry_query.get("timestamp")
+    if isinstance(ts, dict):
+        lower = ts.get("$gte", ts.get("$gt"))
+        upper = ts.get("$lte", ts.get("$lt"))
+    elif isinstance(ts, datetime):
+        lower = upper = ts
+
+    # keyset cursor: {"$or": [{timestamp < t}, {timestamp == t, _id < id}]}
+    or_upper = None
+    for clause in entry_query.get("$or", []):
+        bound = clause.get("timestamp")
+        if isinstance(bound, dict):
+            bound = bound.get("$lte", bound.get("$lt"))
+        if not isinstance(bound, datetime):
+            or_upper = None
+            break
+        or_upper = bound if or_upper is None else max(or_upper, bound)
+    if or_upper is not None:
+        upper = or_upper if upper is None else min(upper, or_upper)
+    return lower, upper
+
+
+def bucket_match(account_id: str, entry_query: dict) -> dict:
+    """
+    Buckets of the account that can hold entries matching entry_query
+    """
+    match = {"account_id": account_id}
+    lower, upper = _time_bounds(entry_query)
+    if lower is not None:
+        match["last_ts"] = {"$gte": lower}
+    if upper is not None:
+        match["first_ts"] = {"$lte": upper}
+    return match
+
+
+def cold_pipeline(account_id: str, entry_query: dict, projection: dict | None,
+                  newest_first: bool, limit: int | None = None) -> list:
+    pipeline = [
+        {"$match": bucket_match(account_id, entry_query)},
+        {"$sort": {"last_ts": -1 if newest_first else 1}},
+    ]
+    if newest_first:
+        # entries are stored oldest first; reversed, the stream is already in order and $limit stops early
+        pipeline.append({"$set": {"entries": {"$reverseArray": "$entries"}}})
+    pipeline += [{"$unwind": "$entries"}, {"$replaceRoot": {"newRoot": "$entries"}}]
+    if entry_query:
+        pipeline.append({"$match": entry_query})
+    if limit:
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    return pipeline
+
+
+async def find_newest(query: dict, projection: dict | None, limit: int) -> list:
+    """
+    Up to `limit` legs matching query, newest first, across all tiers
+    """
+    rows = await transactions_collection.find(query, projection) \
+        .sort(NEWEST_FIRST).limit(limit).to_list(limit)
+    if len(rows) >= limit:
+        return rows
+
+    account_id, entry_query = _split(query)
+    for tier in COLD_TIERS:
+        wanted = limit - len(rows)
+        rows += await tier.aggregate(cold_pipeline(account_id, entry_query, projection, True, wanted)).to_list(wanted)
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+async def find_one_newest(query: dict, projection: dict | None = None):
+    rows = await find_newest(query, projection, 1)
+    return rows[0] if rows else None
+
+
+async def find_one_oldest(query: dict, projection: dict | None = None):
+    account_id, entry_query = _split(query)
+    for tier in reversed(COLD_TIERS):
+        rows = await tier.aggregate(cold_pipeline(account_id, entry_query, projection, False, 1)).to_list(1)
+        if rows:
+            return rows[0]
+    return await transactions_collection.find_one(query, projection, sort=OLDEST_FIRST)
+
+
+async def iter_oldest(query: dict, projection: dict | None = None, batch_size: int = 1000):
+    """
+    Every leg matching query, oldest first, archive -> buckets -> flat, streamed
+    """
+    account_id, entry_query = _split(query)
+    for tier in reversed(COLD_TIERS):
+        async for row in tier.aggregate(cold_pipeline(account_id, entry_query, projection, False), batchSize=batch_size):
+            yield row
+    async for row in transactions_collection.find(query, projection).sort(OLDEST_FIRST).batch_size(batch_size):
+        yield row
+
+
+async def closing_balances(account_ids: list, before: datetime) -> dict:
+    """
+    account_id -> balance_after of its last cold leg before `before`
+    """
+    pipeline = [
+        {"$match": {"account_id": {"$in": account_ids}, "first_ts": {"$lt": before}}},
+        {"$sort": {"account_id": 1, "first_ts": -1}},
+        {"$group": {"_id": "$account_id", "entries": {"$first": "$entries"}}},
+        # the newest bucket may straddle `before`; keep its last entry that does not
+        {"$project": {"last": {"$arrayElemAt": [
+            {"$filter": {"input": "$entries", "as": "e", "cond": {"$lt": ["$$e.timestamp", before]}}}, -1
+        ]}}},
+    ]
+    balances = {}
+    for tier in reversed(COLD_TIERS):
+        async for row in tier.aggregate(pipeline):
+            balances[row["_id"]] = row["last"]["balance_after"]
+    return balances
@@ -1,44 +1,36 @@
 
-from bson import ObjectId
+from bson import ObjectId, Decimal128
+from decimal import Decimal
+from .serializers import encode_account
 
 def serialize_account(account: dict) -> dict:
     """
     Convert MongoDB ObjectId to string and remove sensitive info
     """
-    account_copy = account.copy()
-
-    if "_id" in account_copy:
-        account_copy["_id"] = str(account_copy["_id"])
-
-    if "customer" in account_copy and "password" in account_copy["customer"]:
-        del account_copy["customer"]["password"]
+    return encode_account(account)
 
-    return account_copy
+def _clean_decimal128(value):
+    try:
+        return round(float(value.to_decimal()), 2)
+    except Exception:
+        return 0.0
 
-from bson import ObjectId, Decimal128
-from decimal import Decimal
+# exact-type dispatch; plain values (str, int, float, datetime, ...) fall through untouched
+_CONVERTERS = {
+    ObjectId: str,
+    Decimal128: _clean_decimal128,
+    Decimal: lambda value: round(float(value), 2),
+}
 
 def clean_mongo_value(value):
     """Recursively convert MongoDB-specific types to safe JSON types."""
-    if isinstance(value, ObjectId):
-        return str(value)
-
-    if isinstance(value, Decimal128):
-        try:
-            return round(float(value.to_decimal()), 2)
-        except Exception:
-            return 0.0
-
-    if isinstance(value, Decimal):
-        return round(float(value), 2)
-
-    if isinstance(value, dict):
+    kind = type(value)
+    if kind is dict:
         return {k: clean_mongo_value(v) for k, v in value.items()}
-
-    if isinstance(value, list):
+    if kind is list:
         return [clean_mongo_value(v) for v in value]
-
-    return value
+    converter = _CONVERTERS.get(kind)
+    return converter(value) if converter else value
 
 def serialize_doc(doc):
     if not doc:
@@ -47,3 +39,22 @@ def serialize_doc(doc):
 
 def serialize_list(docs):
     return [clean_mongo_value(d) for d in docs]
+
+
+import base64
+import json
+from datetime import datetime
+
+def encode_cursor(timestamp: datetime, doc_id) -> str:
+    """Opaque keyset cursor for (timestamp, _id) ordered pages."""
+    raw = json.dumps({"t": timestamp.isoformat(), "id": str(doc_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises ValueError on a malformed token."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
@@ -0,0 +1,59 @@
+
+from bson import ObjectId
+from fastapi import Request, Response
+from .db import accounts_collection
+from .cache import principal_cache
+
+# Document versions for conditional GETs. Every write to an account or a loan
+# bumps that document's `version`; a loan write also bumps its owner's
+# `loans_version` (and, being an account write, the account's `version`).
+# Both counters live in the principal cache's mutable half, so the read
+# endpoints can compare If-None-Match against the cached principal and answer
+# 304 without touching Mongo or re-serializing. Like balances, a write made on
+# another worker is seen once the change feed invalidates the entry or, without
+# change streams, after PRINCIPAL_BALANCE_TTL_SECONDS.
+BUMP = {"version": 1}
+# the same bump as a $set stage, for pipeline-style updates
+BUMP_STAGE = {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}
+CACHE_CONTROL = "private, no-cache"
+
+
+def versioned(update: dict) -> dict:
+    """
+    update with version +1 added to its $inc
+    """
+    return {**update, "$inc": {**update.get("$inc", {}), **BUMP}}
+
+
+async def touch_loans(*user_ids, session=None):
+    """
+    After a loan write: bump the owners' loans_version so cached loan listings go stale
+    """
+    ids = [ObjectId(user_id) for user_id in {str(u) for u in user_ids}]
+    await accounts_collection.update_many(
+        {"_id": {"$in": ids}}, {"$inc": {"loans_version": 1, **BUMP}}, session=session
+    )
+    for account_id in ids:
+        principal_cache.invalidate_balance(account_id)
+
+
+# -------------------- ETags --------------------
+def etag(kind: str, *parts) -> str:
+    return '"%s"' % "-".join([kind, *(str(p) for p in parts)])
+
+
+def not_modified(request: Request, tag: str) -> Response | None:
+    """
+    A 304 when If-None-Match already names tag, else None
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = {c.strip().removeprefix("W/") for c in header.split(",")}
+    if tag in candidates or "*" in candidates:
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+def etag_headers(tag: str) -> dict:
+    return {"ETag": tag, "Cache-Control": CACHE_CONTROL}
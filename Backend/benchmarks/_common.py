@@ -0,0 +1,87 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Every script runs against MONGO_URL but switches to a scratch database
+(BENCH_MONGO_DB, default "finex_bench") before any app module is imported,
+so production collections are never touched.
+
+Run from Backend/, e.g.  python -m benchmarks.bench_deposit_withdraw
+"""
+import os
+import statistics
+import time
+from contextlib import asynccontextmanager
+
+os.environ["MONGO_DB"] = os.getenv("BENCH_MONGO_DB", "finex_bench")
+
+# settings app.auth needs at import time; real values from .env win
+for key, value in {
+    "APP_SECRET_KEY": "bench-secret",
+    "SECRET_KEY": "bench-admin-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "ADMIN_EMAIL": "admin@bench.example.com",
+    "ADMIN_PASSWORD": "bench-admin",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+def use_stand_in():
+    """
+    Swap Motor's client for mongomock-motor's in-process one (pip install
+    mongomock-motor). Must run before any app module is imported. The stand-in
+    has no sessions, so anything that needs a multi-document transaction fails,
+    and background jobs that use bulk_write may log errors.
+    """
+    try:
+        import mongomock_motor
+    except ImportError:
+        raise SystemExit("--stand-in needs mongomock-motor: pip install mongomock-motor")
+    import motor.motor_asyncio
+
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    os.environ.setdefault("MONGO_URL", "mongodb://stand-in")
+
+
+@asynccontextmanager
+async def app_client():
+    """
+    httpx client wired straight to the ASGI app, with the lifespan hooks run
+    """
+    import httpx
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+def percentiles(samples_ms: list) -> dict:
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "p99_ms": pick(99),
+    }
+
+
+async def timed(fn, *args):
+    start = time.perf_counter()
+    result = await fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def report(title: str, rows: dict):
+    print(f"\n== {title}")
+    for name, stats in rows.items():
+        cells = "  ".join(f"{k}={v}" for k, v in stats.items())
+        print(f"{name:28} {cells}")
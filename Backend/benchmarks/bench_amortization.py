@@ -0,0 +1,63 @@
+"""
+Full schedules for a large loan book: scalar per-loan loop vs app.amortization.
+
+The scalar side is the straightforward month-by-month loop; it is timed on a
+sample and extrapolated, since running it over 1M loans takes minutes.
+
+    python -m benchmarks.bench_amortization [loans] [scalar_sample]
+"""
+import sys
+import time
+import numpy as np
+from app import amortization
+
+
+def scalar_schedule(principal, annual_rate, months):
+    r = annual_rate / 1200
+    if r == 0:
+        payment = principal / months
+    else:
+        payment = principal * r * (1 + r) ** months / ((1 + r) ** months - 1)
+    balance = principal
+    rows = []
+    for month in range(1, months + 1):
+        interest = balance * r
+        principal_paid = payment - interest
+        balance -= principal_paid
+        rows.append((month, interest, principal_paid, max(balance, 0.0)))
+    return payment, rows
+
+
+def main(loans: int, sample: int):
+    rng = np.random.default_rng(42)
+    principal = rng.uniform(10_000, 1_000_000, loans).round(2)
+    rate = rng.choice([0.0, 7.5, 8.0, 10.0, 12.0], loans)
+    months = rng.integers(6, 61, loans)
+
+    start = time.perf_counter()
+    for i in range(sample):
+        scalar_schedule(float(principal[i]), float(rate[i]), int(months[i]))
+    scalar_per_loan = (time.perf_counter() - start) / sample
+
+    start = time.perf_counter()
+    checksum = 0.0
+    for offset, (payment, interest, _, balance) in amortization.iter_book_schedules(principal, rate, months):
+        checksum += float(interest.sum())
+    vectorized = time.perf_counter() - start
+
+    # spot-check that both agree
+    for i in rng.integers(0, loans, 20):
+        payment, rows = scalar_schedule(float(principal[i]), float(rate[i]), int(months[i]))
+        _, interest, _, balance = amortization.book_schedules([principal[i]], [rate[i]], [months[i]])
+        assert abs(rows[-1][3] - balance[0, months[i] - 1]) < 1e-4
+        assert np.allclose([row[1] for row in rows], interest[0, :months[i]], atol=1e-6)
+
+    scalar_total = scalar_per_loan * loans
+    print(f"{loans:,} loans, total interest {checksum:,.0f}")
+    print(f"scalar loop  ~{scalar_total:8.2f}s  (extrapolated from {sample:,} loans)")
+    print(f"vectorized    {vectorized:8.2f}s  ({scalar_total / vectorized:.0f}x)")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [1_000_000, 20_000][len(args):]))
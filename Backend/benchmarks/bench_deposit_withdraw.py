@@ -0,0 +1,85 @@
+"""
+Before/after latency of deposit + withdraw.
+
+"legacy" replays the original four round trips (read, $set, insert, re-read);
+"atomic" calls app.ledger, which does one conditional update plus the ledger insert.
+
+    python -m benchmarks.bench_deposit_withdraw [iterations]
+"""
+import asyncio
+import sys
+from datetime import datetime
+from . import _common
+from app.db import accounts_collection, transactions_collection
+from app.ledger import apply_deposit, apply_withdraw
+
+
+async def legacy_deposit(account_id, amount):
+    account = await accounts_collection.find_one({"_id": account_id})
+    new_balance = round(account["balance"] + amount, 2)
+    await accounts_collection.update_one({"_id": account_id}, {"$set": {"balance": new_balance}})
+    await transactions_collection.insert_one({
+        "account_id": str(account_id), "type": "deposit", "amount": amount,
+        "balance_after": new_balance, "timestamp": datetime.utcnow(),
+    })
+    return await accounts_collection.find_one({"_id": account_id})
+
+
+async def legacy_withdraw(account_id, amount):
+    account = await accounts_collection.find_one({"_id": account_id})
+    new_balance = round(account["balance"] - amount, 2)
+    await accounts_collection.update_one({"_id": account_id}, {"$set": {"balance": new_balance}})
+    await transactions_collection.insert_one({
+        "account_id": str(account_id), "type": "withdraw", "amount": amount,
+        "balance_after": new_balance, "timestamp": datetime.utcnow(),
+    })
+    return await accounts_collection.find_one({"_id": account_id})
+
+
+async def seed_account(number: str):
+    await accounts_collection.delete_many({"account_number": number})
+    result = await accounts_collection.insert_one({
+        "account_number": number,
+        "account_type": "savings",
+        "balance": 1_000_000.0,
+        "status": "active",
+        "created_at": datetime.utcnow(),
+        "customer": {"full_name": "Bench", "email": f"{number.lower()}@bench.example.com"},
+    })
+    return result.inserted_id
+
+
+async def run(fn, account_id, iterations):
+    samples = []
+    for _ in range(iterations):
+        _, ms = await _common.timed(fn, account_id, 10.0)
+        samples.append(ms)
+    return _common.percentiles(samples)
+
+
+async def lost_updates(deposit_fn, account_id, concurrency=50):
+    before = (await accounts_collection.find_one({"_id": account_id}))["balance"]
+    await asyncio.gather(*(deposit_fn(account_id, 1.0) for _ in range(concurrency)))
+    after = (await accounts_collection.find_one({"_id": account_id}))["balance"]
+    return round(concurrency - (after - before), 2)
+
+
+async def main(iterations: int):
+    account_id = await seed_account("BENCHDW1")
+    rows = {
+        "legacy deposit": await run(legacy_deposit, account_id, iterations),
+        "atomic deposit": await run(apply_deposit, account_id, iterations),
+        "legacy withdraw": await run(legacy_withdraw, account_id, iterations),
+        "atomic withdraw": await run(apply_withdraw, account_id, iterations),
+    }
+    _common.report(f"deposit/withdraw latency ({iterations} sequential calls)", rows)
+    _common.report("lost updates with 50 concurrent deposits", {
+        "legacy": {"lost": await lost_updates(legacy_deposit, account_id)},
+        "atomic": {"lost": await lost_updates(apply_deposit, account_id)},
+    })
+    await transactions_collection.delete_many({"account_id": str(account_id)})
+    await accounts_collection.delete_one({"_id": account_id})
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,118 @@
+"""
+Many senders paying one merchant: direct transfers vs hot-account write-combining.
+
+Direct mode runs transfer_funds, so every credit updates the merchant document
+inside its own transaction. Those transactions conflict on the merchant and
+retry. Hot mode debits each sender in its own transaction and lets the flusher
+apply the merchant's credits in batches. Throughput counts until the merchant
+has actually been credited, so queued credits are not counted as done.
+
+Requires a replica set (multi-document transactions), e.g. a single-node
+`mongod --replSet rs0`.
+
+    python -m benchmarks.bench_hot_account [transfers] [concurrency] [senders]
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime
+from fastapi import HTTPException
+from . import _common
+from app.db import accounts_collection, transactions_collection
+from app.ledger import transfer_funds
+from app.hot_accounts import transfer_to_hot_account, hot_credits, HOT_FLUSH_INTERVAL_SECONDS
+
+OPENING_BALANCE = 1_000_000.0
+MERCHANT = "BENCHHOT000"
+
+
+async def seed(senders: int) -> tuple:
+    numbers = [MERCHANT] + [f"BENCHHOT{i:03d}" for i in range(1, senders + 1)]
+    await accounts_collection.delete_many({"account_number": {"$in": numbers}})
+    result = await accounts_collection.insert_many([
+        {
+            "account_number": number,
+            "account_type": "current",
+            "balance": OPENING_BALANCE,
+            "status": "active",
+            "created_at": datetime.utcnow(),
+            "customer": {"full_name": "Bench", "email": f"{number.lower()}@bench.example.com"},
+        }
+        for number in numbers
+    ])
+    return result.inserted_ids[0], result.inserted_ids[1:]
+
+
+async def balance(account_id) -> float:
+    return (await accounts_collection.find_one({"_id": account_id}, {"balance": 1}))["balance"]
+
+
+async def flusher(stop: asyncio.Event):
+    # stands in for the app's scheduled flush, which is not running here
+    while not stop.is_set():
+        await hot_credits.flush()
+        await asyncio.sleep(HOT_FLUSH_INTERVAL_SECONDS)
+
+
+async def run(mode: str, transfers: int, concurrency: int, senders: int) -> dict:
+    merchant_id, sender_ids = await seed(senders)
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, rejected = [], 0
+
+    async def one():
+        nonlocal rejected
+        sender_id = random.choice(sender_ids)
+        amount = round(random.uniform(1, 50), 2)
+        async with semaphore:
+            try:
+                if mode == "hot":
+                    _, ms = await _common.timed(transfer_to_hot_account, sender_id, merchant_id, MERCHANT, amount)
+                else:
+                    _, ms = await _common.timed(transfer_funds, sender_id, MERCHANT, amount)
+                samples.append(ms)
+            except HTTPException:
+                rejected += 1
+
+    stop = asyncio.Event()
+    flush_task = asyncio.create_task(flusher(stop)) if mode == "hot" else None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(transfers)))
+    if flush_task:
+        stop.set()
+        await flush_task
+        await hot_credits.flush()
+    elapsed = time.perf_counter() - start
+
+    ids = [merchant_id, *sender_ids]
+    totals = [await balance(i) for i in ids]
+    pending = await transactions_collection.count_documents(
+        {"account_id": {"$in": [str(i) for i in sender_ids]}, "credit_status": "pending"}
+    )
+    conserved = abs(sum(totals) - OPENING_BALANCE * len(ids)) < 0.01
+
+    await transactions_collection.delete_many({"account_id": {"$in": [str(i) for i in ids]}})
+    await accounts_collection.delete_many({"_id": {"$in": ids}})
+
+    stats = _common.percentiles(samples)
+    stats.update({
+        "rejected": rejected,
+        "credited_per_s": round(len(samples) / elapsed, 1),
+        "pending_left": pending,
+        "conserved": conserved,
+    })
+    return stats
+
+
+async def main(transfers: int, concurrency: int, senders: int):
+    rows = {mode: await run(mode, transfers, concurrency, senders) for mode in ("direct", "hot")}
+    _common.report(f"{transfers} transfers from {senders} senders to one merchant, concurrency {concurrency}", rows)
+    speedup = rows["hot"]["credited_per_s"] / max(rows["direct"]["credited_per_s"], 0.1)
+    print(f"hot / direct throughput: {speedup:.1f}x")
+    assert all(row["conserved"] and not row["pending_left"] for row in rows.values()), "balances not conserved"
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(*(args + [5000, 128, 200][len(args):])))
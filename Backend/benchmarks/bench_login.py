@@ -0,0 +1,92 @@
+"""
+p99 latency of /accounts/me while a burst of logins is in flight.
+
+Runs a steady stream of /accounts/me calls twice: alone, then alongside
+concurrent /users/login calls. With Argon2 off the event loop the two p99s
+should be close; with hashing inline they diverge by the hash time times the
+login burst size.
+
+    python -m benchmarks.bench_login [logins] [login_concurrency] [me_calls]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+from . import _common
+from app.auth import hash_password_async, create_access_token
+from app.db import accounts_collection
+
+PASSWORD = "bench-password"
+USERS = 32
+
+
+async def seed():
+    hashed = await hash_password_async(PASSWORD)
+    emails = [f"login{i}@bench.example.com" for i in range(USERS)]
+    await accounts_collection.delete_many({"customer.email": {"$in": emails}})
+    await accounts_collection.insert_many([
+        {
+            "account_number": f"BENCHLG{i:03d}",
+            "account_type": "savings",
+            "balance": 1000.0,
+            "status": "active",
+            "created_at": datetime.utcnow(),
+            "customer": {"full_name": "Bench", "email": email, "password": hashed},
+        }
+        for i, email in enumerate(emails)
+    ])
+    return emails
+
+
+async def me_loop(client, token, calls):
+    samples = []
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = await client.get("/accounts/me", headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return samples
+
+
+async def login_burst(client, emails, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/users/login", json={"email": emails[i % len(emails)], "password": PASSWORD})
+            samples.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(logins)))
+    return samples, logins / (time.perf_counter() - start)
+
+
+async def main(logins: int, concurrency: int, me_calls: int):
+    async with _common.app_client() as client:
+        emails = await seed()
+        token = create_access_token(subject=emails[0])
+
+        idle = await me_loop(client, token, me_calls)
+        (busy, (login_samples, login_rate)) = await asyncio.gather(
+            me_loop(client, token, me_calls),
+            login_burst(client, emails, logins, concurrency),
+        )
+
+        login_stats = _common.percentiles(login_samples)
+        login_stats["logins_per_s"] = round(login_rate, 1)
+        _common.report("login throughput", {"/users/login": login_stats})
+        _common.report("/accounts/me latency", {
+            "without logins": _common.percentiles(idle),
+            "during logins": _common.percentiles(busy),
+        })
+
+        await accounts_collection.delete_many({"customer.email": {"$in": emails}})
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(*(args + [200, 32, 500][len(args):])))
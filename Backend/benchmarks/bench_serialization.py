@@ -0,0 +1,117 @@
+"""
+Serialization cost per 10k documents: the original path vs app.serializers.
+
+"before" is the original pipeline (recursive clean_mongo_value or the per-row
+reshaping in the routers, then jsonable_encoder, then stdlib json).
+"after" is what the app does now: the shape-specialized encoder, then a
+MongoJSONResponse built and rendered with orjson. Listing routes build that
+response themselves; money routes (deposit, withdraw, transfer, pay-emi)
+return their handler's dict, which run_idempotent wraps the same way; the
+"deposit" shape measures that second style. No database is needed.
+
+    python -m benchmarks.bench_serialization [documents]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from bson import ObjectId, Decimal128
+from fastapi.encoders import jsonable_encoder
+from app.serializers import MongoJSONResponse, encode_account, encode_transaction, encode_loan
+
+
+def legacy_clean(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return round(float(value.to_decimal()), 2)
+    if isinstance(value, Decimal):
+        return round(float(value), 2)
+    if isinstance(value, dict):
+        return {k: legacy_clean(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [legacy_clean(v) for v in value]
+    return value
+
+
+def legacy_transaction(txn):
+    txn = dict(txn)
+    txn["_id"] = str(txn["_id"])
+    txn["amount"] = round(float(txn["amount"]), 2)
+    txn["balance_after"] = round(float(txn["balance_after"]), 2)
+    txn["timestamp"] = txn["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+    return txn
+
+
+def accounts(n):
+    return [{
+        "_id": ObjectId(), "account_number": f"ACC{i:06d}", "account_type": "savings",
+        "balance": 1234.56 + i, "status": "active", "created_at": datetime(2024, 1, 1) + timedelta(minutes=i),
+        "customer": {
+            "full_name": "Jane Doe", "dob": "1990-01-01", "gender": "F", "email": f"u{i}@example.com",
+            "password": "$argon2id$v=19$m=65536,t=3,p=4$abc$def", "phone": "9999999999",
+            "address": {"street": "1 Main St", "city": "Pune", "state": "MH", "zip": "411001", "country": "IN"},
+            "id_proof": {"type": "PAN", "number": "ABCDE1234F"},
+        },
+    } for i in range(n)]
+
+
+def transactions(n):
+    return [{
+        "_id": ObjectId(), "account_id": str(ObjectId()), "type": "transfer_sent", "amount": 100.5,
+        "balance_after": 900.25, "to_account": "ACC000001", "timestamp": datetime(2024, 1, 1) + timedelta(seconds=i),
+    } for i in range(n)]
+
+
+def loans(n):
+    return [{
+        "_id": ObjectId(), "user_id": str(ObjectId()), "scheme_id": str(ObjectId()), "scheme_name": "Home",
+        "amount": Decimal128("250000.00"), "duration_months": 60, "interest_rate": 8.5, "status": "Ongoing",
+        "emi_amount": 5129.14, "remaining_months": 40, "applied_at": datetime(2024, 1, 1),
+        "approved_at": datetime(2024, 1, 2), "next_due_date": datetime(2024, 6, 1),
+    } for i in range(n)]
+
+
+def deposit_responses(n):
+    return [{
+        "message": "Successfully deposited 100.5",
+        "new_balance": account["balance"],
+        "account": account,
+    } for account in accounts(n)]
+
+
+def render(content) -> bytes:
+    return MongoJSONResponse(content).body
+
+
+def clock(fn, docs, rounds=5):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(docs)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(n: int):
+    cases = {
+        "account": (accounts(n), lambda d: json.dumps(jsonable_encoder([legacy_clean(x) for x in d])),
+                    lambda d: render([encode_account(x) for x in d])),
+        "transaction": (transactions(n), lambda d: json.dumps(jsonable_encoder([legacy_transaction(x) for x in d])),
+                        lambda d: render([encode_transaction(x) for x in d])),
+        "loan": (loans(n), lambda d: json.dumps(jsonable_encoder([legacy_clean(x) for x in d])),
+                 lambda d: render([encode_loan(x) for x in d])),
+        # one response per document, as n separate requests would produce
+        "deposit": (deposit_responses(n),
+                    lambda d: [json.dumps(jsonable_encoder({**x, "account": legacy_clean(x["account"])})) for x in d],
+                    lambda d: [render({**x, "account": encode_account(x["account"])}) for x in d]),
+    }
+    print(f"best of 5, {n:,} documents per shape")
+    for shape, (docs, before, after) in cases.items():
+        b, a = clock(before, docs), clock(after, docs)
+        print(f"{shape:12} before {b:8.1f} ms   after {a:7.1f} ms   ({b / a:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
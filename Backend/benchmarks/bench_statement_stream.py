@@ -0,0 +1,56 @@
+"""
+Peak RSS while streaming a large synthetic statement.
+
+Feeds N synthetic rows through app.statements.statement_chunks (the encoder
+behind /accounts/statement) and discards the output like a socket would.
+Peak RSS must stay flat regardless of N.
+
+    python -m benchmarks.bench_statement_stream [rows] [csv|ndjson]
+"""
+import asyncio
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+from app.statements import statement_chunks
+
+MAX_RSS_GROWTH_MB = 64
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def synthetic_rows(count: int):
+    start = datetime(2015, 1, 1)
+    balance = 0.0
+    for i in range(count):
+        amount = float(i % 500 + 1)
+        kind = "deposit" if i % 3 else "withdraw"
+        balance += amount if kind == "deposit" else -amount
+        yield {
+            "timestamp": start + timedelta(minutes=i),
+            "type": kind,
+            "amount": amount,
+            "balance_after": balance,
+        }
+
+
+async def main(count: int, fmt: str):
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    total_bytes = 0
+    async for chunk in statement_chunks(synthetic_rows(count), fmt, opening_balance=0.0):
+        total_bytes += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    growth = peak_rss_mb() - baseline
+    print(f"{count} rows as {fmt}: {total_bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+          f"({count / elapsed:,.0f} rows/s), peak RSS growth {growth:.1f} MB")
+    assert growth < MAX_RSS_GROWTH_MB, f"peak RSS grew by {growth:.1f} MB"
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+                     sys.argv[2] if len(sys.argv) > 2 else "csv"))
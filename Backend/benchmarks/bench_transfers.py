@@ -0,0 +1,81 @@
+"""
+Concurrent transfers between a small set of hot accounts.
+
+Requires a replica set (multi-document transactions), e.g. a single-node
+`mongod --replSet rs0`. Reports throughput and latency, and asserts that the
+total balance across the accounts is conserved.
+
+    python -m benchmarks.bench_transfers [transfers] [concurrency] [accounts]
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime
+from fastapi import HTTPException
+from . import _common
+from app.db import accounts_collection, transactions_collection
+from app.ledger import transfer_funds
+
+OPENING_BALANCE = 10_000.0
+
+
+async def seed(count: int) -> list:
+    numbers = [f"BENCHTR{i:03d}" for i in range(count)]
+    await accounts_collection.delete_many({"account_number": {"$in": numbers}})
+    result = await accounts_collection.insert_many([
+        {
+            "account_number": number,
+            "account_type": "current",
+            "balance": OPENING_BALANCE,
+            "status": "active",
+            "created_at": datetime.utcnow(),
+            "customer": {"full_name": "Bench", "email": f"{number.lower()}@bench.example.com"},
+        }
+        for number in numbers
+    ])
+    return list(zip(result.inserted_ids, numbers))
+
+
+async def total_balance(ids) -> float:
+    pipeline = [{"$match": {"_id": {"$in": ids}}}, {"$group": {"_id": None, "total": {"$sum": "$balance"}}}]
+    rows = await accounts_collection.aggregate(pipeline).to_list(1)
+    return round(rows[0]["total"], 2)
+
+
+async def main(transfers: int, concurrency: int, count: int):
+    accounts = await seed(count)
+    ids = [account_id for account_id, _ in accounts]
+    before = await total_balance(ids)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, rejected = [], 0
+
+    async def one():
+        nonlocal rejected
+        (sender_id, _), (_, receiver_number) = random.sample(accounts, 2)
+        async with semaphore:
+            try:
+                _, ms = await _common.timed(transfer_funds, sender_id, receiver_number, round(random.uniform(1, 50), 2))
+                samples.append(ms)
+            except HTTPException:
+                rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(transfers)))
+    elapsed = time.perf_counter() - start
+
+    after = await total_balance(ids)
+    stats = _common.percentiles(samples)
+    stats.update({"rejected": rejected, "throughput_per_s": round(len(samples) / elapsed, 1)})
+    _common.report(f"{transfers} transfers across {count} accounts, concurrency {concurrency}", {"transfer_funds": stats})
+    print(f"total balance before={before} after={after}")
+
+    await transactions_collection.delete_many({"account_id": {"$in": [str(i) for i in ids]}})
+    await accounts_collection.delete_many({"_id": {"$in": ids}})
+    assert abs(before - after) < 0.01, "total balance was not conserved"
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(*(args + [2000, 64, 8][len(args):])))
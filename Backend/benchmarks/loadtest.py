@@ -0,0 +1,327 @@
+"""
+Mixed-workload load test of the whole API, driven through the ASGI app.
+
+Seeds accounts, transactions and loans into the bench database, then runs the
+same weighted mix of requests at each concurrency level and reports
+throughput and p50/p95/p99 per operation. Results are written as JSON so
+runs on different commits can be diffed.
+
+Against a local mongod (transfers need a replica set, e.g. `mongod --replSet rs0`):
+
+    python -m benchmarks.loadtest --concurrency 1,16,64 --requests 5000 --output run.json
+
+Without a mongod, --stand-in runs against mongomock-motor in-process. It has
+no transactions and no $round, so transfers and deposits are left out of the
+mix. Its numbers measure the app's own overhead, not Mongo.
+
+    python -m benchmarks.loadtest --stand-in --accounts 200 --requests 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from . import _common
+
+SEED_PREFIX = "LOAD"
+SEED_PASSWORD = "load-test-password"
+SCHEME_NAME = "Load Test Scheme"
+
+DEFAULT_MIX = {
+    "login": 2,
+    "me": 30,
+    "deposit": 15,
+    "transfer": 10,
+    "history": 20,
+    "loan_apply": 5,
+    "loan_approve": 5,
+    "pay_emi": 13,
+}
+NEEDS_TRANSACTIONS = {"transfer"}
+# balance updates round on the server with $round, which mongomock does not implement
+NEEDS_ROUND = {"deposit"}
+
+
+# -------------------- Seeding --------------------
+async def clear_seed():
+    from app.db import accounts_collection, transactions_collection, loans_collection, emi_history_collection
+
+    ids = [str(doc["_id"]) async for doc in accounts_collection.find(
+        {"account_number": {"$regex": f"^{SEED_PREFIX}"}}, {"_id": 1}
+    )]
+    await transactions_collection.delete_many({"account_id": {"$in": ids}})
+    await loans_collection.delete_many({"user_id": {"$in": ids}})
+    await emi_history_collection.delete_many({"user_id": {"$in": ids}})
+    await accounts_collection.delete_many({"account_number": {"$regex": f"^{SEED_PREFIX}"}})
+
+
+async def seed(accounts: int, transactions: int, loans: int, rng: random.Random) -> dict:
+    from app.auth import hash_password, create_access_token
+    from app.db import accounts_collection, transactions_collection, loans_collection, loan_schemes_collection
+    from app.ledger import ledger_entry
+
+    await clear_seed()
+    password_hash = hash_password(SEED_PASSWORD)  # one Argon2 hash shared by every seeded account
+    now = datetime.utcnow()
+
+    docs = [
+        {
+            "account_number": f"{SEED_PREFIX}{i:07d}",
+            "account_type": "savings",
+            "balance": 1_000_000.0,
+            "status": "active",
+            "created_at": now - timedelta(days=400),
+            "customer": {
+                "full_name": f"Load {i}",
+                "email": f"load{i}@bench.example.com",
+                "password": password_hash,
+                "phone": "0",
+            },
+        }
+        for i in range(accounts)
+    ]
+    result = await accounts_collection.insert_many(docs)
+    users = [
+        {"id": account_id, "email": doc["customer"]["email"], "account_number": doc["account_number"],
+         "headers": {"Authorization": f"Bearer {create_access_token(doc['customer']['email'])}"}}
+        for account_id, doc in zip(result.inserted_ids, docs)
+    ]
+
+    for start in range(0, transactions, 10_000):
+        batch = []
+        for _ in range(min(10_000, transactions - start)):
+            user = rng.choice(users)
+            entry = ledger_entry(user["id"], rng.choice(["deposit", "withdraw"]), round(rng.uniform(1, 500), 2), 1_000_000.0)
+            entry["timestamp"] = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            batch.append(entry)
+        await transactions_collection.insert_many(batch)
+
+    await loan_schemes_collection.update_one(
+        {"name": SCHEME_NAME},
+        {"$setOnInsert": {"name": SCHEME_NAME, "interest_rate": 9.0, "max_amount": 1_000_000.0,
+                          "status": "active", "created_at": now}},
+        upsert=True,
+    )
+    scheme = await loan_schemes_collection.find_one({"name": SCHEME_NAME})
+
+    loan_docs = [
+        {
+            "user_id": str(users[i % len(users)]["id"]),
+            "scheme_id": str(scheme["_id"]),
+            "scheme_name": SCHEME_NAME,
+            "amount": 100_000.0,
+            "duration_months": 100_000,  # long enough that pay-emi never runs the loan out
+            "remaining_months": 100_000,
+            "interest_rate": 9.0,
+            "emi_amount": 1000.0,
+            "status": "Ongoing",
+            "applied_at": now - timedelta(days=90),
+            "next_due_date": now + timedelta(days=30),
+        }
+        for i in range(loans)
+    ]
+    loan_ids = (await loans_collection.insert_many(loan_docs)).inserted_ids if loan_docs else []
+    owners = {str(u["id"]): u for u in users}
+    return {
+        "users": users,
+        "scheme_id": str(scheme["_id"]),
+        "loans": [(str(loan_id), owners[doc["user_id"]]) for loan_id, doc in zip(loan_ids, loan_docs)],
+    }
+
+
+# -------------------- Operations --------------------
+class Workload:
+    def __init__(self, client, data: dict, admin_headers: dict, rng: random.Random):
+        self.client = client
+        self.users = data["users"]
+        self.loans = data["loans"]
+        self.scheme_id = data["scheme_id"]
+        self.admin_headers = admin_headers
+        self.rng = rng
+        self.pending_loans = deque()
+
+    async def login(self):
+        user = self.rng.choice(self.users)
+        return await self.client.post("/users/login", json={"email": user["email"], "password": SEED_PASSWORD})
+
+    async def me(self):
+        return await self.client.get("/accounts/me", headers=self.rng.choice(self.users)["headers"])
+
+    async def deposit(self):
+        user = self.rng.choice(self.users)
+        return await self.client.post("/accounts/deposit", json={"amount": round(self.rng.uniform(1, 100), 2)},
+                                      headers=user["headers"])
+
+    async def transfer(self):
+        sender, receiver = self.rng.sample(self.users, 2)
+        return await self.client.post("/accounts/transfer", headers=sender["headers"], json={
+            "receiver_account_number": receiver["account_number"], "amount": round(self.rng.uniform(1, 100), 2),
+        })
+
+    async def history(self):
+        return await self.client.get("/accounts/transactions", params={"limit": 20},
+                                     headers=self.rng.choice(self.users)["headers"])
+
+    async def loan_apply(self):
+        response = await self.client.post("/loans/apply", headers=self.rng.choice(self.users)["headers"], json={
+            "scheme_id": self.scheme_id, "amount": 50_000, "duration_months": 24,
+        })
+        if response.status_code == 200:
+            self.pending_loans.append(response.json()["loan"]["_id"])
+        return response
+
+    async def loan_approve(self):
+        if not self.pending_loans:
+            return await self.loan_apply()
+        loan_id = self.pending_loans.popleft()
+        return await self.client.put(f"/admin/loans/approve/{loan_id}", headers=self.admin_headers)
+
+    async def pay_emi(self):
+        loan_id, owner = self.rng.choice(self.loans)
+        return await self.client.post(f"/loans/pay-emi/{loan_id}", headers=owner["headers"])
+
+
+async def run_level(workload: Workload, mix: dict, concurrency: int, total: int, rng: random.Random) -> dict:
+    names, weights = list(mix), list(mix.values())
+    plan = rng.choices(names, weights=weights, k=total)
+    samples = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(plan):
+            name = plan[position]
+            position += 1
+            response, ms = await _common.timed(getattr(workload, name))
+            samples[name].append(ms)
+            code = str(response.status_code)
+            statuses[name][code] = statuses[name].get(code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ops = {}
+    for name in names:
+        if samples[name]:
+            ops[name] = {**_common.percentiles(samples[name]), "statuses": statuses[name]}
+    errors = sum(n for s in statuses.values() for code, n in s.items() if code.startswith("5"))
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(total / elapsed, 1),
+        "server_errors": errors,
+        "overall": _common.percentiles([ms for values in samples.values() for ms in values]),
+        "ops": ops,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(text: str | None) -> dict:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"unknown operation {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    skipped = {}
+    if args.stand_in:
+        for name in NEEDS_TRANSACTIONS & set(mix):
+            skipped[name] = "stand-in has no multi-document transactions"
+            del mix[name]
+        for name in NEEDS_ROUND & set(mix):
+            skipped[name] = "stand-in has no $round"
+            del mix[name]
+
+    async with _common.app_client() as client:
+        data = await seed(args.accounts, args.transactions, args.loans, rng)
+        if not data["loans"]:
+            mix.pop("pay_emi", None)
+        response = await client.post("/admin/auth/login", json={
+            "email": os.environ["ADMIN_EMAIL"], "password": os.environ["ADMIN_PASSWORD"],
+        })
+        admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        workload = Workload(client, data, admin_headers, rng)
+
+        if args.warmup:
+            await run_level(workload, mix, 4, args.warmup, rng)
+
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(workload, mix, concurrency, args.requests, rng)
+            levels.append(level)
+            _common.report(f"concurrency {concurrency}: {level['throughput_per_s']} req/s, "
+                           f"{level['server_errors']} server errors", {
+                               name: {k: v for k, v in stats.items() if k != "statuses"}
+                               for name, stats in level["ops"].items()
+                           })
+
+        if not args.keep:
+            await clear_seed()
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "backend": "stand-in" if args.stand_in else "mongod",
+            "seed": args.seed,
+            "dataset": {"accounts": args.accounts, "transactions": args.transactions, "loans": args.loans},
+            "mix": mix,
+            "skipped": skipped,
+        },
+        "levels": levels,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"\nresults written to {args.output}")
+    else:
+        print(text)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stand-in", action="store_true", help="run against mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--loans", type=int, default=500)
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=200, help="requests to run before measuring")
+    parser.add_argument("--mix", help="weights, e.g. me=50,deposit=25,history=25 (default: the full mix)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded data in place")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args(sys.argv[1:])
+    if arguments.stand_in:
+        _common.use_stand_in()
+    asyncio.run(main(arguments))
@@ -22,4 +22,5 @@ export const depositMoney = (amount) => api.post("/accounts/deposit", { amount }
 export const withdrawMoney = (amount) => api.post("/accounts/withdraw", { amount });
 export const transferMoney = (receiver_account_number, amount) =>
   api.post("/accounts/transfer", { receiver_account_number, amount });
-export const getTransactions = () => api.get("/accounts/transactions");
+export const getTransactions = (params = {}) =>
+  api.get("/accounts/transactions", { params });
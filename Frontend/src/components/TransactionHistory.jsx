@@ -12,7 +12,7 @@ export default function TransactionHistory() {
   const fetchTransactions = async () => {
     setLoading(true);
     try {
-      const res = await getTransactions();
+      const res = await getTransactions({ limit: 100 });
       setTransactions(res.data.transactions);
       setFiltered(res.data.transactions);
     } catch (err) {